@@ -1,476 +1,969 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify
 import requests
-from bs4 import BeautifulSoup
-import re
 import json
 from urllib.parse import urlencode
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from assets import INDEX, IMMUTABLE, REVALIDATE, AssetStore, choose_encoding, compress
+from log import fields, logger
+from barcodes import BarcodeValidator, InvalidBarcodeError
+from metrics import (
+    BARCODE_REJECTED,
+    CACHE_LOOKUPS,
+    PARSE_MEMO,
+    SEARCH_IN_FLIGHT,
+    SEARCH_SECONDS,
+    STREAMED_PAGES,
+    observe_phase,
+    render_metrics,
+    timed,
+)
+from parse_memo import ParseMemo
+from breaker import CircuitOpenError
+from ratelimit import BACKGROUND, BATCH, INTERACTIVE, RateLimitError, RateLimiter
+from stock_cache import StockCache, EXPIRED, NEGATIVE, STALE
+from singleflight import SingleFlight
+from snapshots import HotRefresher, SnapshotStore, parse_timestamp
+from stock_parser import DIGITS_RE, StockPageStream, build_index, iter_stock_page
+from stores import StoreRegistry
+from upstream import STOCK_URL, UpstreamClient
 
 app = Flask(__name__, template_folder='.')
 
+# index.html ve static dosyalar açılışta belleğe alınır, önceden sıkıştırılır
+static_assets = AssetStore(app.root_path)
+
+# Bu boyutun altındaki JSON cevapları sıkıştırılmaz (byte)
+COMPRESS_MIN_SIZE = int(os.environ.get('MUDO_COMPRESS_MIN_SIZE', 1024))
+
+# Worker'lar arası paylaşılan sonuç cache'i (SQLite)
+stock_cache = StockCache.from_env()
+
+# Upstream'e gitmeden önce barkod biçimi ve kontrol hanesi denetimi
+barcode_validator = BarcodeValidator.from_env()
+
+# Upstream bilinmeyen barkod için yalnızca bu varsayılan mağazayı listeler
+# (arayüzdeki "Geçersiz Barkod" kontrolüyle aynı)
+NOT_FOUND_STORE = 'cevahir'
+
+# Kanonik mağaza kayıtları ve öncelikli mağaza
+store_registry = StoreRegistry.from_env()
+
+# Worker başına havuzlu upstream istemcisi; hız sınırı tüm worker'larla paylaşılır
+upstream = UpstreamClient.from_env(RateLimiter.from_env(stock_cache.path))
+
+# Değişmeyen sayfaları tekrar parse etmemek için özet -> sonuç tablosu
+parse_memo = ParseMemo.from_env()
+
+# Akışlı parse (isteğe bağlı): gövde parça parça indirilip indekslenir, ürün
+# başlığı, varyant ve mağaza tabloları yakalanınca sayfanın geri kalanı
+# indirilmez. Mağaza tablosundan sonra gelen veri (ikinci mağaza tablosu,
+# indirim vb.) sonuca girmez; bu yüzden varsayılan tam parse'tır.
+STREAM_PARSE = os.environ.get('MUDO_STREAM_PARSE', '0') == '1'
+STREAM_CHUNK_SIZE = int(os.environ.get('MUDO_STREAM_CHUNK_SIZE', 16384))
+# Erken durulan cevabın kalanı bu kadardan azsa okunur, bağlantı havuza döner
+STREAM_DRAIN_BYTES = int(os.environ.get('MUDO_STREAM_DRAIN_BYTES', 32768))
+
+# Aynı barkod için eşzamanlı upstream çağrılarını birleştirir
+stock_flight = SingleFlight(stock_cache.path)
+
+# Kalıcı barkod/mağaza stok geçmişi
+snapshot_store = SnapshotStore.from_env()
+
+# Toplu sorgu ayarları
+BATCH_CONCURRENCY = int(os.environ.get('MUDO_BATCH_CONCURRENCY', 8))
+BATCH_MAX_ITEMS = int(os.environ.get('MUDO_BATCH_MAX_ITEMS', 200))
+
+# Varyant ön-yükleme ayarları
+PREFETCH_WORKERS = int(os.environ.get('MUDO_PREFETCH_WORKERS', 2))
+PREFETCH_MAX_VARIANTS = int(os.environ.get('MUDO_PREFETCH_MAX_VARIANTS', 12))
+
+# Düşük öncelikli arka plan işleri için küçük, ayrı bir havuz
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+prefetch_pending = set()
+prefetch_lock = threading.Lock()
+
+def asset_response(asset, immutable):
+    """Bellekteki dosyayı pazarlıklı kodlama, ETag ve cache başlıklarıyla döndürür"""
+    encoding, body, etag = asset.variant(request.headers.get('Accept-Encoding'))
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': IMMUTABLE if immutable else REVALIDATE,
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, headers=headers, content_type=asset.content_type)
+
 # Static dosyalar için route
 @app.route('/<path:filename>')
 def static_files(filename):
-    """CSS, JS ve diğer static dosyaları serve etmek için"""
-    if filename.endswith('.css') or filename.endswith('.js') or filename.endswith('.ico'):
-        return send_from_directory('.', filename)
-    return "File not found", 404
+    """CSS, JS ve diğer static dosyaları serve etmek için
+
+    İçerik özetli adlar (style.3f2a9c1e.css) immutable olarak cache'lenir.
+    """
+    found = static_assets.get(filename) if filename != INDEX else None
+    if found is None:
+        return "File not found", 404
+    return asset_response(*found)
+
+@app.after_request
+def compress_json(response):
+    """JSON cevaplarını Accept-Encoding'e göre gzip/br ile sıkıştırır"""
+    if (response.mimetype != 'application/json' or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        with timed('compress'):
+            response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def filter_stock_data(stock_data):
+    """Ham stok satırlarını mağaza kayıtlarına göre filtreler ve sıralar
+
+    (final liste, öncelikli mağaza) döndürür.
+    """
+    # Duplicate'leri temizle ve gereksiz verileri filtrele
+    unique_stock_data = []
+    seen = set()
+    
+    for item in stock_data:
+        store_name = item['store'].lower().strip()
+        stock_count = item['stock'].strip()
+        
+        # Whitelist kontrolü - gerçek mağaza ismi var mı? (tek derlenmiş regex)
+        store = store_registry.match(item['store'])
+        if store is None:
+            continue
+        
+        # Stok sayısı kontrolü - sadece sayı içermeli
+        if not DIGITS_RE.search(stock_count) or len(stock_count) > 10:
+            continue
+        
+        # Çok kısa veya çok uzun isimler
+        if len(store_name) < 4 or len(store_name) > 60:
+            continue
+        
+        # Duplicate kontrolü
+        key = (store_name, stock_count)
+        if key not in seen:
+            seen.add(key)
+            unique_stock_data.append((item, store))
+    
+    # Öncelikli mağazayı (varsayılan Vadistanbul City 183) ayır
+    priority_store = None
+    other_stores = []
+    
+    for item, store in unique_stock_data:
+        # Mağaza adını kanonik isimle standardize et
+        item['store'] = store.name
+        item['store_id'] = store.id
+        if store_registry.is_priority(store):
+            priority_store = item
+            item['is_priority'] = True
+        else:
+            other_stores.append(item)
+    
+    # Öncelikli mağazayı en başa koy
+    final_stock_data = []
+    if priority_store:
+        final_stock_data.append(priority_store)
+    final_stock_data.extend(other_stores)
+    return final_stock_data, priority_store
+
+def build_stock_result(html, url, on_stage=None):
+    """Stok sayfası HTML'inden /search sonuç sözlüğünü oluşturur
+
+    on_stage verilirse her bölüm hazır olduğu anda on_stage(aşama, veri)
+    çağrılır: 'product_info', 'variants' ve filtrelenmiş 'stock'.
+    """
+    # HTML içeriğini tek geçişte parse et (lxml)
+    with timed('parse'):
+        doc = build_index(html)
+    return indexed_stock_result(doc, url, on_stage)
+
+def indexed_stock_result(doc, url, on_stage=None):
+    """İndekslenmiş sayfadan sonuç sözlüğünü oluşturur (bkz. build_stock_result)"""
+    parsed = {}
+    with timed('extract'):
+        for stage, value in iter_stock_page(doc):
+            parsed[stage] = value
+            if on_stage is not None and stage != 'stock_data':
+                on_stage(stage, value)
+    product_info = parsed['product_info']
+    variants = parsed['variants']
+    stock_data = parsed['stock_data']
+    
+    with timed('filter'):
+        final_stock_data, priority_store = filter_stock_data(stock_data)
+    
+    if on_stage is not None:
+        on_stage('stock', {'stock_data': final_stock_data, 'priority_store': priority_store})
+    
+    logger.debug("Stok verileri filtrelendi", extra=fields(
+        url=url, raw=len(stock_data), final=len(final_stock_data),
+        priority_found=priority_store is not None, variants=len(variants)
+    ))
+    
+    return {
+        'success': True,
+        'product_info': product_info,
+        'stock_data': final_stock_data,
+        'variants': variants,  # Yeni: Varyant bilgilerini ekle
+        'priority_store': priority_store,
+        'total_filtered': len(stock_data) - len(final_stock_data),
+        'url': url
+    }
+
+def replay_stages(result, on_stage):
+    """Hazır sonucun aşamalarını on_stage'e sırasıyla bildirir"""
+    on_stage('product_info', result['product_info'])
+    on_stage('variants', result['variants'])
+    on_stage('stock', {'stock_data': result['stock_data'], 'priority_store': result['priority_store']})
+
+def not_modified_result(url, on_stage=None):
+    """Upstream 304 döndüğünde son sayfanın sonucu; bellekte yoksa None"""
+    result = parse_memo.not_modified(url)
+    if result is None:
+        return None
+    PARSE_MEMO.labels('not_modified').inc()
+    if on_stage is not None:
+        replay_stages(result, on_stage)
+    return dict(result, url=url)
+
+def remembered_result(url, digest, headers, build, on_stage=None):
+    """Özeti bilinen sayfanın sonucunu bellekten, yoksa build() ile üretir"""
+    result = parse_memo.get(digest)
+    if result is None:
+        PARSE_MEMO.labels('miss').inc()
+        result = build()
+        parse_memo.put(digest, result)
+    else:
+        PARSE_MEMO.labels('hit').inc()
+        if on_stage is not None:
+            replay_stages(result, on_stage)
+    parse_memo.remember(url, headers.get('ETag'), headers.get('Last-Modified'), digest)
+    return dict(result, url=url)
+
+def memoized_stock_result(url, response, on_stage=None):
+    """Cevap gövdesi daha önce parse edildiyse sonucu tekrar kullanır
+
+    requests ve httpx cevaplarıyla çalışır.
+    """
+    digest = parse_memo.digest(response.content)
+    return remembered_result(url, digest, response.headers,
+                             lambda: build_stock_result(response.text, url, on_stage), on_stage)
+
+def is_store_row(store, stock):
+    """Tablo satırı mağaza/stok satırı mı (akışlı parse'ın durma koşulu)"""
+    return DIGITS_RE.search(stock) is not None and store_registry.match(store) is not None
+
+def page_stream(response):
+    """Cevabın karakter kodlamasıyla akışlı sayfa indeksi (requests/httpx)"""
+    return StockPageStream(response.encoding or 'utf-8', is_store_row)
+
+def streamed_page_done(stream, download_seconds, parse_seconds):
+    """Akışlı parse'ın faz sürelerini ve sonucunu metriklere yazar"""
+    observe_phase('upstream_download', download_seconds)
+    observe_phase('parse', parse_seconds)
+    STREAMED_PAGES.labels('early_exit' if stream.complete else 'full').inc()
+    logger.debug("Akışlı parse", extra=fields(
+        bytes=stream.bytes_fed, early_exit=stream.complete
+    ))
+
+def wants_prefix(prefix, size):
+    """Önceki cevabın okunan kısmıyla karşılaştırmak için tamponlamaya devam edilsin mi"""
+    if prefix is None:
+        return False
+    length, complete, _ = prefix
+    return not complete or size < length
+
+def prefix_result(url, prefix, buffered, response, on_stage=None):
+    """Tamponlanan gövde önceki cevabın okunan kısmıyla aynıysa memodaki sonuç; değilse None
+
+    Erken durulan sayfada önekin, tam okunan sayfada bütün gövdenin özeti
+    karşılaştırılır; eşleşirse sayfa hiç indekslenmez.
+    """
+    length, complete, digest = prefix
+    body = b''.join(buffered)
+    if (len(body) < length) if complete else (len(body) != length):
+        return None
+    if parse_memo.digest(body[:length]) != digest:
+        return None
+    STREAMED_PAGES.labels('memo_hit').inc()
+
+    def build():
+        # Sonuç bu arada memodan düştüyse önek tek parçada indekslenir
+        stream = page_stream(response)
+        stream.feed(body[:length])
+        return indexed_stock_result(stream.close(), url, on_stage)
+
+    result = remembered_result(url, digest, response.headers, build, on_stage)
+    if complete:
+        result['partial'] = True
+    return result
+
+def drain(chunks):
+    """Erken bırakılan cevabın kalanını STREAM_DRAIN_BYTES'a kadar okuyup atar"""
+    drained = 0
+    for chunk in chunks:
+        drained += len(chunk)
+        if drained > STREAM_DRAIN_BYTES:
+            break
+
+def streamed_stock_result(url, response, on_stage=None):
+    """Gövdeyi indirirken parça parça indeksler; gerekli bölümler gelince bırakır
+
+    Bellekte tam gövde ve tam DOM tutulmaz. Memo özeti okunan kısmın
+    özetidir; aynı önek aynı noktada durur ve aynı sonucu verir. URL'nin
+    önceki cevabı biliniyorsa gövde önce o uzunluğa kadar tamponlanıp
+    özeti karşılaştırılır; sayfa değişmediyse hiç indekslenmez. Kalan
+    gövde STREAM_DRAIN_BYTES'tan küçükse okunup atılır (keep-alive korunur),
+    büyükse bağlantı kapatılır.
+    """
+    chunks = response.iter_content(STREAM_CHUNK_SIZE)
+    download_seconds = parse_seconds = 0.0
+
+    prefix = parse_memo.stream_prefix(url)
+    buffered = []
+    size = 0
+    while wants_prefix(prefix, size):
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        download_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        buffered.append(chunk)
+        size += len(chunk)
+    if prefix is not None:
+        result = prefix_result(url, prefix, buffered, response, on_stage)
+        if result is not None:
+            observe_phase('upstream_download', download_seconds)
+            if prefix[1]:
+                drain(chunks)
+            return result
 
-def scrape_mudo_stock(barcode):
-    """Mudo API'sinden stok bilgilerini çeker"""
+    stream = page_stream(response)
+    hasher = parse_memo.hasher()
+    pending = iter(buffered)
+    while True:
+        start = time.perf_counter()
+        chunk = next(pending, None) or next(chunks, None)
+        download_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        hasher.update(chunk)
+        start = time.perf_counter()
+        complete = stream.feed(chunk)
+        parse_seconds += time.perf_counter() - start
+        if complete:
+            break
+    start = time.perf_counter()
+    doc = stream.close()
+    parse_seconds += time.perf_counter() - start
+    streamed_page_done(stream, download_seconds, parse_seconds)
+
+    digest = hasher.hexdigest()
+    result = remembered_result(url, digest, response.headers,
+                               lambda: indexed_stock_result(doc, url, on_stage), on_stage)
+    parse_memo.remember_prefix(url, stream.bytes_fed, stream.complete, digest)
+    if stream.complete:
+        # Sayfanın sonu okunmadı; stok geçmişi görülmeyen mağazaları bitmiş saymasın
+        result['partial'] = True
+        drain(chunks)
+    return result
+
+def scrape_mudo_stock(barcode, on_stage=None, priority=INTERACTIVE):
+    """Mudo API'sinden stok bilgilerini çeker
+
+    priority hız sınırlayıcı önceliğidir; None ise jeton prepaid_fetch'te
+    önceden alınmıştır.
+    """
     try:
         # Mudo stok sorgulama URL'si
-        url = f"http://mudonetapps.mudo.com.tr/StokSorgula/StokSorgula?kod={barcode}"
-        
-        # HTTP headers - gerçek tarayıcı gibi görünmek için
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'tr-TR,tr;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        print(f"Sorgu URL: {url}")
-        
-        # HTTP isteği gönder
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        print(f"HTTP Status: {response.status_code}")
-        print(f"Content Length: {len(response.text)}")
-        
-        # HTML içeriğini parse et
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Farklı yöntemlerle stok bilgilerini bulmaya çalış
-        stock_data = []
-        product_info = {}
-        variants = []  # Yeni: Varyant bilgileri
-        
-        # 1. Ürün ismi ve başlık bilgisini al (Title'dan değil, ürün detaylarından)
-        # Title bilgisini son çare olarak al
-        page_title = soup.find('title')
-        if page_title:
-            title_text = page_title.get_text().strip()
-            if title_text and title_text != "MUDO - Stok Sorgula":
-                product_info['title'] = title_text
-        
-        # Ürün ismini farklı yerlerden aramaya çalış
-        product_name = None
-        
-        # 1. H1, H2, H3 başlıklarında ara
-        for heading in soup.find_all(['h1', 'h2', 'h3']):
-            text = heading.get_text().strip()
-            if text and len(text) > 5 and 'stok' not in text.lower() and 'mudo' not in text.lower():
-                product_name = text
-                break
-        
-        # 2. Script tag'lerinde ürün ismi ara
-        if not product_name:
-            scripts = soup.find_all('script', string=True)
-            for script in scripts:
-                script_content = script.string
-                if script_content:
-                    # "urunAdi" veya benzer pattern'leri ara
-                    name_patterns = [
-                        r'"urunAdi"\s*:\s*"([^"]+)"',
-                        r'"productName"\s*:\s*"([^"]+)"',
-                        r'"name"\s*:\s*"([^"]+)"',
-                        r'urunAdi\s*=\s*"([^"]+)"'
-                    ]
-                    
-                    for pattern in name_patterns:
-                        match = re.search(pattern, script_content)
-                        if match and len(match.group(1)) > 5:
-                            product_name = match.group(1)
-                            break
-                    
-                    if product_name:
-                        break
-        
-        # 3. Ürün kodu ile birlikte ürün ismi çek
-        if not product_name:
-            # Tablolarda ürün ismini ara
-            tables = soup.find_all('table')
-            for table in tables:
-                for row in table.find_all('tr'):
-                    cells = row.find_all(['td', 'th'])
-                    if len(cells) >= 2:
-                        label = cells[0].get_text().strip().lower()
-                        value = cells[1].get_text().strip()
-                        
-                        if ('ürün ad' in label or 'model ad' in label or 'isim' in label) and len(value) > 5:
-                            product_name = value
-                            break
-                
-                if product_name:
-                    break
-        
-        # Ürün ismini product_info'ya ekle
-        if product_name:
-            product_info['title'] = product_name
-            print(f"🎯 Ürün ismi bulundu: {product_name}")
-        else:
-            print("⚠️ Ürün ismi bulunamadı, varsayılan başlık kullanılacak")
-        
-        # Ürün detay bilgilerini çek
-        product_details = {}
-        
-        # Ürün bilgilerini içeren div/span/td elementlerini ara
-        all_elements = soup.find_all(['div', 'span', 'td', 'p'])
-        for element in all_elements:
-            text = element.get_text().strip()
-            
-            # Ürün kodu pattern'i
-            if re.search(r'ürün\s*no|model\s*no|ürün\s*kodu', text.lower()):
-                # Bir sonraki elementi veya aynı elementteki kodu bul
-                code_match = re.search(r'(\d{3}-\d-\d{3}-\d{2}-\d{3}|\d+)', text)
-                if code_match:
-                    product_details['product_code'] = code_match.group(1)
-            
-            # Fiyat bilgisi
-            if re.search(r'₺|tl|lira|fiyat', text.lower()) and re.search(r'\d+', text):
-                price_match = re.search(r'(\d+[.,]?\d*)\s*(?:₺|tl)', text)
-                if price_match:
-                    product_details['price'] = price_match.group(1).replace(',', '.') + ' TL'
-            
-            # Satış durumu
-            if re.search(r'satış\s*durumu|durum', text.lower()):
-                if 'açık' in text.lower():
-                    product_details['sale_status'] = 'Satışta'
-                elif 'kapalı' in text.lower():
-                    product_details['sale_status'] = 'Satış Dışı'
-            
-            # İndirim oranı
-            if '%' in text and re.search(r'\d+', text):
-                discount_match = re.search(r'%\s*(\d+)', text)
-                if discount_match:
-                    product_details['discount'] = f"%{discount_match.group(1)} İndirim"
-        
-        # Form elementlerinden de bilgi çek
-        inputs = soup.find_all('input')
-        for inp in inputs:
-            if inp.get('id') or inp.get('name'):
-                field_name = (inp.get('id') or inp.get('name')).lower()
-                value = inp.get('value', '').strip()
-                
-                if 'fiyat' in field_name and value and re.search(r'\d', value):
-                    product_details['price'] = value + ' TL'
-                elif 'kod' in field_name and value:
-                    product_details['product_code'] = value
-        
-        # Tablo hücrelerinden ürün bilgilerini çek
-        tables = soup.find_all('table')
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows:
-                cells = row.find_all(['td', 'th'])
-                if len(cells) >= 2:
-                    label = cells[0].get_text().strip().lower()
-                    value = cells[1].get_text().strip()
-                    
-                    if 'ürün no' in label or 'model no' in label:
-                        product_details['product_code'] = value
-                    elif 'fiyat' in label and value:
-                        product_details['price'] = value
-                    elif 'durum' in label or 'satış' in label:
-                        product_details['sale_status'] = value
-        
-        product_info.update(product_details)
-        
-        print(f"🔍 Product Info Debug: {product_info}")
-        print(f"🔍 Title: {product_info.get('title', 'YOK')}")
-        
-        # 2. Varyant tablosunu ara (Renk/Beden kombinasyonları)
-        print("🎨 Varyant bilgileri aranıyor...")
-        variant_tables = soup.find_all('table')
-        for table in variant_tables:
-            # Tablo başlıklarını kontrol et
-            headers = table.find_all('th')
-            header_texts = [th.get_text().strip().lower() for th in headers]
-            
-            # Varyant tablosu olup olmadığını kontrol et
-            if any(keyword in ' '.join(header_texts) for keyword in ['renk', 'beden', 'mal no', 'barkod']):
-                print("✅ Varyant tablosu bulundu!")
-                rows = table.find_all('tr')[1:]  # İlk satır başlık
-                
-                for row in rows:
-                    cells = row.find_all(['td', 'th'])
-                    if len(cells) >= 4:  # En az 4 sütun olmalı
-                        try:
-                            # Sütunları parse et
-                            color = cells[0].get_text().strip() if len(cells) > 0 else ""
-                            size = cells[1].get_text().strip() if len(cells) > 1 else ""
-                            product_code = cells[2].get_text().strip() if len(cells) > 2 else ""
-                            variant_barcode = cells[3].get_text().strip() if len(cells) > 3 else ""
-                            
-                            # Geçerli varyant mı kontrol et
-                            if (color and size and variant_barcode and 
-                                len(variant_barcode) >= 10 and variant_barcode.isdigit()):
-                                
-                                variants.append({
-                                    'color': color,
-                                    'size': size,
-                                    'product_code': product_code,
-                                    'barcode': variant_barcode,
-                                    'display_name': f"{color} - {size}"
-                                })
-                                print(f"🎨 Varyant: {color} - {size} ({variant_barcode})")
-                        except Exception as e:
-                            print(f"⚠️ Varyant parse hatası: {e}")
-                            continue
-        
-        # 3. Tablo içindeki stok bilgilerini ara
-        tables = soup.find_all('table')
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows:
-                cells = row.find_all(['td', 'th'])
-                if len(cells) >= 2:
-                    store_name = cells[0].get_text().strip()
-                    stock_count = cells[1].get_text().strip()
-                    
-                    # Sayısal değer var mı kontrol et
-                    if store_name and (re.search(r'\d+', stock_count) or 'stok' in stock_count.lower()):
-                        stock_data.append({
-                            'store': store_name,
-                            'stock': stock_count
-                        })
-        
-        # 4. Div elementlerindeki stok bilgilerini ara
-        divs = soup.find_all('div')
-        for div in divs:
-            text = div.get_text().strip()
-            # Mağaza adı ve stok sayısı pattern'leri
-            patterns = [
-                r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+)',
-                r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+\s*adet)',
-                r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+\s*stok)'
-            ]
-            
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    store_name = match.group(1).strip()
-                    stock_count = match.group(2).strip()
-                    if 2 < len(store_name) < 50:
-                        stock_data.append({
-                            'store': store_name,
-                            'stock': stock_count
-                        })
-        
-        # 5. Span elementlerindeki bilgileri ara
-        spans = soup.find_all('span')
-        store_names = []
-        stock_counts = []
-        
-        for span in spans:
-            text = span.get_text().strip()
-            # Sadece sayı
-            if re.match(r'^\d+$', text):
-                stock_counts.append(text)
-            # Mağaza ismi olabilecek metin
-            elif 3 < len(text) < 50 and '©' not in text and 'http' not in text:
-                store_names.append(text)
-        
-        # Mağaza isimleri ve stok sayılarını eşleştir
-        min_length = min(len(store_names), len(stock_counts))
-        for i in range(min_length):
-            stock_data.append({
-                'store': store_names[i],
-                'stock': stock_counts[i]
-            })
-        
-        # 6. Script taglerindeki JSON verilerini ara
-        scripts = soup.find_all('script')
-        for script in scripts:
-            if script.string:
-                script_content = script.string
-                if any(keyword in script_content.lower() for keyword in ['stok', 'stock', 'magaza']):
-                    print(f"İlgili script bulundu: {script_content[:200]}...")
-                    
-                    # JSON pattern'lerini ara
-                    json_matches = re.findall(r'\{[^{}]*(?:"stok"|"stock"|"magaza")[^{}]*\}', script_content)
-                    for match in json_matches:
-                        try:
-                            data = json.loads(match)
-                            print(f"Script JSON data: {data}")
-                        except json.JSONDecodeError:
-                            continue
-        
-        # Duplicate'leri temizle ve gereksiz verileri filtrele
-        unique_stock_data = []
-        seen = set()
-        
-        # Gerçek mağaza isimlerini tanımlayalım (whitelist yaklaşımı)
-        valid_store_patterns = [
-            # City mağazaları
-            r'.*city.*', r'.*vadistanbul.*', r'.*mall.*', r'.*avm.*', r'.*center.*',
-            # Giyim mağazaları
-            r'.*giyim.*', r'.*home.*', r'.*concept.*', r'.*marina.*', r'.*outlet.*',
-            # Şehir isimleri içeren mağazalar
-            r'.*istanbul.*', r'.*ankara.*', r'.*izmir.*', r'.*bursa.*', r'.*antalya.*',
-            r'.*adana.*', r'.*trabzon.*', r'.*kayseri.*', r'.*samsun.*', r'.*gaziantep.*',
-            r'.*malatya.*', r'.*eskişehir.*', r'.*bodrum.*', r'.*marmaris.*',
-            # Belirli mağaza isimleri
-            r'.*akmerkez.*', r'.*cevahir.*', r'.*carousel.*', r'.*palladium.*',
-            r'.*nautilus.*', r'.*aqua.*', r'.*tema.*', r'.*nişantaşı.*', r'.*maslak.*',
-            r'.*pendik.*', r'.*capitol.*', r'.*çanakkale.*', r'.*balıkesir.*',
-            r'.*tekirdağ.*', r'.*bandırma.*', r'.*mersin.*', r'.*alanya.*'
-        ]
-        
-        for item in stock_data:
-            store_name = item['store'].lower().strip()
-            stock_count = item['stock'].strip()
-            
-            # Önce whitelist kontrolü - gerçek mağaza ismi var mı?
-            is_valid_store = False
-            for pattern in valid_store_patterns:
-                if re.search(pattern, store_name):
-                    is_valid_store = True
-                    break
-            
-            # Eğer geçerli mağaza ismi değilse, filtrelenecek veriler listesini kontrol et
-            if not is_valid_store:
-                continue
-                
-            # Stok sayısı kontrolü - sadece sayı içermeli
-            if not re.search(r'\d+', stock_count) or len(stock_count) > 10:
-                continue
-                
-            # Çok kısa veya çok uzun isimler
-            if len(store_name) < 4 or len(store_name) > 60:
-                continue
-            
-            # Duplicate kontrolü
-            key = (store_name, stock_count)
-            if key not in seen:
-                seen.add(key)
-                unique_stock_data.append(item)
-        
-        # Vadistanbul City (183) mağazasını öncelikli olarak ayır
-        priority_store = None
-        other_stores = []
-        
-        for item in unique_stock_data:
-            store_name = item['store'].lower()
-            # Vadistanbul City'yi farklı şekillerde arayalım
-            if 'vadistanbul' in store_name and 'city' in store_name:
-                priority_store = item
-                # Mağaza adını temizle ve standardize et
-                item['store'] = "Vadistanbul City (183)"
-                item['is_priority'] = True
-            else:
-                # Diğer mağaza isimlerini de temizle
-                clean_name = item['store'].strip()
-                # Satır sonlarını ve gereksiz boşlukları temizle
-                clean_name = re.sub(r'\s+', ' ', clean_name)
-                item['store'] = clean_name
-                other_stores.append(item)
-        
-        # Öncelikli mağazayı en başa koy
-        final_stock_data = []
-        if priority_store:
-            final_stock_data.append(priority_store)
-        final_stock_data.extend(other_stores)
-        
-        print(f"Filtrelenmiş veriler: Ham {len(stock_data)} -> Geçerli {len(unique_stock_data)} -> Final {len(final_stock_data)}")
-        print(f"Vadistanbul City bulundu: {priority_store is not None}")
-        print(f"Varyant sayısı: {len(variants)}")
-        if final_stock_data:
-            print(f"İlk 3 mağaza: {[item['store'] for item in final_stock_data[:3]]}")
-        
-        return {
-            'success': True,
-            'product_info': product_info,
-            'stock_data': final_stock_data,
-            'variants': variants,  # Yeni: Varyant bilgilerini ekle
-            'priority_store': priority_store,
-            'total_filtered': len(stock_data) - len(final_stock_data),
-            'url': url
-        }
-        
+        url = STOCK_URL.format(barcode=barcode)
+        
+        # HTTP isteği gönder (havuzlu keep-alive session, bağlantı hatalarında retry)
+        # Sayfa önceden alındıysa koşullu istek; 304 ise parse edilmez
+        response = upstream.get(url, priority=priority, stream=STREAM_PARSE,
+                                headers=parse_memo.conditional_headers(url))
+        if response.status_code == 304:
+            response.close()
+            result = not_modified_result(url, on_stage)
+            if result is not None:
+                return result
+            # Önceden alınan jeton ilk istekte harcandı; ikinci istek kendi jetonunu alır
+            response = upstream.get(url, priority=BACKGROUND if priority is None else priority,
+                                    stream=STREAM_PARSE)
+        try:
+            response.raise_for_status()
+            if STREAM_PARSE:
+                return streamed_stock_result(url, response, on_stage)
+            return memoized_stock_result(url, response, on_stage)
+        finally:
+            response.close()
+        
+    except CircuitOpenError as e:
+        return circuit_open_result(e, url)
+    except RateLimitError as e:
+        return rate_limited_result(e, url)
     except requests.exceptions.RequestException as e:
-        print(f"HTTP isteği hatası: {e}")
+        logger.warning("HTTP isteği hatası", extra=fields(barcode=barcode, error=str(e)))
         return {
             'success': False,
             'error': f'HTTP isteği başarısız: {str(e)}',
             'url': url if 'url' in locals() else None
         }
     except Exception as e:
-        print(f"Genel hata: {e}")
+        logger.exception("Genel hata", extra=fields(barcode=barcode))
         return {
             'success': False,
             'error': f'Beklenmeyen hata: {str(e)}',
             'url': url if 'url' in locals() else None
         }
 
+def circuit_open_result(error, url):
+    """Devre açıkken upstream'e gidilmeden dönen hata sonucu"""
+    return {
+        'success': False,
+        'error': str(error),
+        'circuit_open': True,
+        'url': url
+    }
+
+def rate_limited_result(error, url):
+    """Hız sınırı nedeniyle upstream'e gidilmeden dönen hata sonucu"""
+    return {
+        'success': False,
+        'error': str(error),
+        'rate_limited': True,
+        'url': url
+    }
+
+def expired_fallback(barcode, result):
+    """Devre açıkken veya hız sınırına takılınca süresi dolmuş cache kaydını döndürür; yoksa None"""
+    if result['success'] or not (result.get('circuit_open') or result.get('rate_limited')):
+        return None
+    expired = stock_cache.get_expired(barcode)
+    if expired is None:
+        return None
+    CACHE_LOOKUPS.labels(EXPIRED).inc()
+    return expired, EXPIRED
+
+def is_not_found(result):
+    """Upstream "ürün bulunamadı" sayfası mı: başlık ve varyant yok, stok yalnız varsayılan mağazada"""
+    return (result['success'] and not result.get('product_info', {}).get('title')
+            and not result.get('variants')
+            and all(NOT_FOUND_STORE in item['store'].lower() for item in result.get('stock_data', [])))
+
+def store_result(barcode, result):
+    """Başarılı sonucu cache'e ve stok geçmişine yazar
+
+    Bulunamayan barkod geçmişe yazılmaz, kısa süreli negatif cache'e girer.
+    """
+    if not result['success']:
+        return
+    if stock_cache.negative_ttl > 0 and is_not_found(result):
+        stock_cache.set_negative(barcode, result)
+        return
+    stock_cache.set(barcode, result)
+    snapshot_store.record(barcode, result)
+
+def fetch_stock(barcode, on_stage=None, priority=INTERACTIVE):
+    """Mudo'dan sorgular ve başarılı sonucu cache'e yazar"""
+    result = scrape_mudo_stock(barcode, on_stage, priority)
+    store_result(barcode, result)
+    return result
+
+def prepaid_fetch(barcode, priority, on_stage=None):
+    """Düşük öncelikli sorgu: jetonu singleflight lease'ini almadan önce bekler
+
+    Lease yalnız upstream çağrısı sürerken tutulur; aynı barkodu soran
+    interaktif sorgu arka plan/toplu sorgunun jeton sırasında beklemez.
+    Sorgu başka bir çağrıya katılırsa veya devre bu arada açılırsa jeton
+    kovaya iade edilir. (sonuç, paylaşıldı mı) döndürür.
+    """
+    url = STOCK_URL.format(barcode=barcode)
+    try:
+        upstream.reserve(priority)
+    except CircuitOpenError as e:
+        return circuit_open_result(e, url), False
+    except RateLimitError as e:
+        return rate_limited_result(e, url), False
+    result, shared = stock_flight.do(barcode, lambda: fetch_stock(barcode, on_stage, priority=None))
+    if token_unused(result, shared):
+        upstream.limiter.refund()
+    return result, shared
+
+def token_unused(result, shared):
+    """prepaid_fetch'in aldığı jeton upstream'e gitmeden mi kaldı"""
+    return shared or bool(result.get('circuit_open'))
+
+def refresh_stock(barcode):
+    """Bayat cache kaydını arka planda yeniler (negatif cache'teki barkod hariç)"""
+    if stock_cache.is_negative(barcode):
+        return
+    prepaid_fetch(barcode, BACKGROUND)
+
+# Sık sorgulanan barkodları cache'te sürekli taze tutar
+hot_refresher = HotRefresher.from_env(snapshot_store, refresh_stock)
+
+def get_stock_result(barcode, on_stage=None, priority=INTERACTIVE):
+    """Stok sonucunu cache'ten, yoksa Mudo'dan getirir
+
+    (sonuç, cache durumu) döndürür. Bayat kayıt hemen döndürülür ve tek bir
+    worker tarafından arka planda yenilenir (stale-while-revalidate).
+    Upstream devresi açıksa süresi dolmuş kayıt da döndürülebilir (expired).
+    Bulunamayan barkodun sonucu negatif cache'ten döner (negative) ve
+    sıcak barkod yenileyicisine sayılmaz.
+    on_stage sadece bu çağrı upstream'i kendisi sorgularsa kullanılır.
+    priority upstream sorgusunun hız sınırlayıcıdaki önceliğidir.
+    """
+    cached = cached_stock_result(barcode)
+    if cached is not None:
+        result, state, refresh = cached
+        if refresh:
+            threading.Thread(target=refresh_stock, args=(barcode,), daemon=True).start()
+        return result, state
+    
+    # Aynı barkod zaten sorgulanıyorsa o sorgunun sonucunu bekle
+    if priority == INTERACTIVE:
+        result, shared = stock_flight.do(barcode, lambda: fetch_stock(barcode, on_stage, priority))
+    else:
+        result, shared = prepaid_fetch(barcode, priority, on_stage)
+    return fetched_stock_result(barcode, result, shared)
+
+def cached_stock_result(barcode):
+    """Cache'teki kaydı (sonuç, durum, yenilensin mi) olarak döndürür; yoksa None
+
+    Bayat kaydı yenileme hakkını tek bir worker alır (yenilensin mi=True).
+    """
+    cached = stock_cache.get(barcode)
+    if cached is None:
+        return None
+    result, state = cached
+    if state != NEGATIVE:
+        hot_refresher.track(barcode)
+    refresh = state == STALE and stock_cache.claim_refresh(barcode)
+    CACHE_LOOKUPS.labels(state).inc()
+    return result, state, refresh
+
+def fetched_stock_result(barcode, result, shared):
+    """Upstream sorgusunun sonucunu (sonuç, cache durumu) olarak döndürür"""
+    if not is_not_found(result):
+        hot_refresher.track(barcode)
+    fallback = expired_fallback(barcode, result)
+    if fallback is not None:
+        return fallback
+    state = 'coalesced' if shared else 'miss'
+    CACHE_LOOKUPS.labels(state).inc()
+    return result, state
+
+def prefetch_stock(barcode):
+    """Varyant barkodunu cache'te taze değilse arka planda sorgular"""
+    try:
+        cached = stock_cache.get(barcode)
+        if cached is None or cached[1] == STALE:
+            prepaid_fetch(barcode, BACKGROUND)
+    except Exception as e:
+        logger.warning("Varyant ön-yükleme hatası", extra=fields(barcode=barcode, error=str(e)))
+    finally:
+        with prefetch_lock:
+            prefetch_pending.discard(barcode)
+
+def prefetch_variants(barcode, variants):
+    """Aynı ürünün diğer varyantlarını cache'e ön-yükler
+
+    Kullanıcı beden/renk değiştirdiğinde selectVariant sorgusu cache'ten döner.
+    /search'ün reddedeceği varyant barkodları upstream'e gönderilmez.
+    """
+    for variant in variants[:PREFETCH_MAX_VARIANTS]:
+        variant_barcode = variant.get('barcode')
+        if (not variant_barcode or variant_barcode == barcode
+                or not barcode_validator.is_valid(variant_barcode)):
+            continue
+        with prefetch_lock:
+            if variant_barcode in prefetch_pending:
+                continue
+            prefetch_pending.add(variant_barcode)
+        prefetch_executor.submit(prefetch_stock, variant_barcode)
+
 @app.route('/')
 def index():
-    with open('index.html', 'r', encoding='utf-8') as f:
-        return f.read()
+    return asset_response(*static_assets.get(INDEX))
+
+def search_payload(result, cache_state):
+    """Stok sonucunu /search JSON sözleşmesine çevirir"""
+    if result['success']:
+        stock_data = result.get('stock_data', [])
+        variants = result.get('variants', [])
+        
+        logger.info("Sorgu başarılı", extra=fields(
+            url=result.get('url'), stores=len(stock_data), variants=len(variants), cache=cache_state
+        ))
+        
+        return {
+            'success': True,
+            'stock_data': stock_data,
+            'variants': variants,  # Yeni: Varyant bilgileri
+            'product_info': result.get('product_info', {}),
+            'priority_store': result.get('priority_store'),
+            'debug_info': {
+                'url': result.get('url'),
+                'total_filtered': result.get('total_filtered', 0),
+                'variant_count': len(variants),
+                'cache': cache_state
+            }
+        }
+    
+    logger.warning("Sorgu başarısız", extra=fields(url=result.get('url'), error=result.get('error')))
+    return {
+        'success': False,
+        'error': result.get('error', 'Bilinmeyen hata'),
+        'stock_data': [],
+        'variants': [],
+        'debug_info': {
+            'url': result.get('url')
+        }
+    }
+
+def error_payload(error):
+    """/search hata cevabı"""
+    return {
+        'success': False,
+        'error': error,
+        'stock_data': [],
+        'variants': []
+    }
+
+def validate_barcode(raw):
+    """Barkodu yerelde doğrular; (barkod, None) ya da (None, hata cevabı) döndürür"""
+    try:
+        return barcode_validator.normalize(raw), None
+    except InvalidBarcodeError as e:
+        BARCODE_REJECTED.labels(e.reason).inc()
+        logger.info("Geçersiz barkod reddedildi", extra=fields(barcode=str(raw), reason=e.reason))
+        return None, error_payload(str(e))
 
 @app.route('/search', methods=['POST'])
 def search():
     """Stok sorgulama endpoint'i"""
+    start = time.perf_counter()
+    SEARCH_IN_FLIGHT.inc()
     try:
         # JSON verilerini al
         data = request.get_json()
         barcode = data.get('barcode')
         
-        print(f"🔍 Stok sorgusu başlatılıyor: {barcode}")
-        
         if not barcode:
-            return jsonify({
-                'success': False,
-                'error': 'Barkod numarası gerekli',
-                'stock_data': [],
-                'variants': []
-            })
+            return jsonify(error_payload('Barkod numarası gerekli'))
+        
+        # Hatalı barkod upstream'e gönderilmez
+        barcode, invalid = validate_barcode(barcode)
+        if invalid is not None:
+            return jsonify(invalid)
         
         # Mudo'dan stok bilgilerini çek
-        result = scrape_mudo_stock(str(barcode))
+        result, cache_state = get_stock_result(barcode)
+        payload = search_payload(result, cache_state)
+        with timed('serialize'):
+            response = jsonify(payload)
         
-        if result['success']:
-            stock_data = result.get('stock_data', [])
-            variants = result.get('variants', [])
-            
-            print(f"✅ Sorgu başarılı: {len(stock_data)} mağaza, {len(variants)} varyant")
-            
-            return jsonify({
-                'success': True,
-                'stock_data': stock_data,
-                'variants': variants,  # Yeni: Varyant bilgileri
-                'product_info': result.get('product_info', {}),
-                'priority_store': result.get('priority_store'),
-                'debug_info': {
-                    'url': result.get('url'),
-                    'total_filtered': result.get('total_filtered', 0),
-                    'variant_count': len(variants)
-                }
-            })
+        # Cevap gönderildikten sonra diğer varyantları arka planda ön-yükle
+        variants = payload['variants']
+        if variants and PREFETCH_MAX_VARIANTS > 0:
+            response.call_on_close(lambda: prefetch_variants(barcode, variants))
+        
+        SEARCH_SECONDS.labels(cache_state).observe(time.perf_counter() - start)
+        return response
+        
+    except Exception as e:
+        logger.exception("Endpoint hatası")
+        return jsonify(error_payload(f'Sunucu hatası: {str(e)}'))
+    finally:
+        SEARCH_IN_FLIGHT.dec()
+
+def sse_event(event, data):
+    """Tek bir Server-Sent Events kaydı"""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+def stage_event(stage, value):
+    """on_stage aşamasını SSE olayına çevirir"""
+    return stage, value if stage == 'stock' else {stage: value}
+
+def final_search_events(result, cache_state, sent):
+    """Sonuçtan henüz gönderilmemiş aşamaları ve kapanış olayını üretir"""
+    payload = search_payload(result, cache_state)
+    if not payload['success']:
+        yield 'error', payload
+        return
+    if 'product_info' not in sent:
+        yield 'product_info', {'product_info': payload['product_info']}
+    if 'variants' not in sent:
+        yield 'variants', {'variants': payload['variants']}
+    if 'stock' not in sent:
+        yield 'stock', {'stock_data': payload['stock_data'], 'priority_store': payload['priority_store']}
+    yield 'done', {'success': True, 'debug_info': payload['debug_info']}
+
+def iter_search_events(barcode):
+    """/search sonucunu aşama aşama (olay, veri) ikilileri olarak üretir
+
+    Sorgu ayrı bir thread'de çalışır; upstream'den gelen sayfa parse
+    edilirken product_info, variants ve stock olayları hazır oldukça
+    kuyruktan okunur. Cache'ten (veya birleştirilmiş sorgudan) dönen
+    sonuçta eksik kalan aşamalar sonuçtan tamamlanır. Son olay 'done'
+    ya da 'error'dır.
+    """
+    stages = queue.Queue()
+    
+    def run():
+        try:
+            stages.put(('result', get_stock_result(barcode, on_stage=lambda *stage: stages.put(stage))))
+        except Exception as e:
+            logger.exception("Akış sorgusu hatası", extra=fields(barcode=barcode))
+            stages.put(('exception', e))
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    sent = set()
+    while True:
+        stage, value = stages.get()
+        if stage == 'exception':
+            yield 'error', error_payload(f'Sunucu hatası: {str(value)}')
+            return
+        if stage != 'result':
+            sent.add(stage)
+            yield stage_event(stage, value)
+            continue
+        
+        yield from final_search_events(*value, sent)
+        return
+
+@app.route('/search/stream')
+def search_stream():
+    """Stok sorgulamanın Server-Sent Events (SSE) akışı
+
+    /search ile aynı veriyi aşama aşama gönderir: product_info, variants,
+    stock ve en son done (hata durumunda error). Arayüz ürün başlığını ve
+    varyantları stok filtrelemesi bitmeden gösterebilir.
+    """
+    barcode = request.args.get('barcode', '').strip()
+    invalid = None
+    if barcode:
+        barcode, invalid = validate_barcode(barcode)
+    
+    def generate():
+        if invalid is not None:
+            yield sse_event('error', invalid)
+            return
+        if not barcode:
+            yield sse_event('error', error_payload('Barkod numarası gerekli'))
+            return
+        
+        start = time.perf_counter()
+        variants = []
+        SEARCH_IN_FLIGHT.inc()
+        try:
+            for event, data in iter_search_events(barcode):
+                if event == 'variants':
+                    variants = data['variants']
+                yield sse_event(event, data)
+                if event == 'done':
+                    SEARCH_SECONDS.labels(data['debug_info']['cache']).observe(time.perf_counter() - start)
+        finally:
+            SEARCH_IN_FLIGHT.dec()
+        
+        # Akış bittikten sonra diğer varyantları arka planda ön-yükle
+        if variants and PREFETCH_MAX_VARIANTS > 0:
+            prefetch_variants(barcode, variants)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx arkasında tamponlamayı kapat
+    })
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Toplu stok sorgulama endpoint'i
+
+    Barkod listesini sınırlı eşzamanlılıkla sorgular ve her sonucu hazır
+    olduğu anda bir satır JSON (NDJSON) olarak akıtır.
+    """
+    data = request.get_json(silent=True) or {}
+    barcodes = data.get('barcodes')
+    
+    if not isinstance(barcodes, list) or not barcodes:
+        return jsonify({
+            'success': False,
+            'error': 'Barkod listesi gerekli'
+        }), 400
+    
+    # Boşları at, tekrarları birleştir (sırayı koru)
+    barcodes = list(dict.fromkeys(str(b).strip() for b in barcodes if str(b).strip()))
+    if len(barcodes) > BATCH_MAX_ITEMS:
+        return jsonify({
+            'success': False,
+            'error': f'En fazla {BATCH_MAX_ITEMS} barkod sorgulanabilir'
+        }), 400
+    
+    # Hatalı barkodlar upstream'e gitmeden hata satırı olarak hemen döner
+    rejected = []
+    valid = []
+    for raw in barcodes:
+        barcode, invalid = validate_barcode(raw)
+        if invalid is None:
+            valid.append(barcode)
         else:
-            print(f"❌ Sorgu başarısız: {result.get('error')}")
+            rejected.append({'success': False, 'error': invalid['error'], 'barcode': raw})
+    barcodes = list(dict.fromkeys(valid))
+    
+    logger.info("Toplu sorgu başlatılıyor", extra=fields(count=len(barcodes), rejected=len(rejected)))
+    
+    def generate():
+        for line in rejected:
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+        if not barcodes:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(barcodes)))
+        try:
+            futures = {executor.submit(get_stock_result, barcode, priority=BATCH): barcode for barcode in barcodes}
+            for future in as_completed(futures):
+                barcode = futures[future]
+                try:
+                    result, cache_state = future.result()
+                    line = dict(result, barcode=barcode, cache=cache_state)
+                except Exception as e:
+                    line = {
+                        'success': False,
+                        'error': f'Sunucu hatası: {str(e)}',
+                        'barcode': barcode
+                    }
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        finally:
+            # İstemci bağlantıyı keserse bekleyen sorguları iptal et
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/stock/<barcode>')
+def stock_snapshot(barcode):
+    """Barkodun yerelde kayıtlı son mağaza stokları (upstream'e gitmez)"""
+    snapshot = snapshot_store.latest(barcode)
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'error': 'Bu barkod için kayıtlı stok bilgisi yok'
+        }), 404
+    return jsonify(dict(snapshot, success=True))
+
+@app.route('/stock/<barcode>/history')
+def stock_history(barcode):
+    """Barkodun mağaza bazında stok değişimleri
+
+    Sorgu parametreleri: store_id (tek mağaza), since (ISO 8601 tarih/saat),
+    limit (1-5000, varsayılan 500).
+    """
+    try:
+        since = request.args.get('since')
+        since = parse_timestamp(since) if since else None
+        limit = max(1, min(int(request.args.get('limit', 500)), 5000))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Geçersiz parametre: {str(e)}'
+        }), 400
+    
+    changes = snapshot_store.history(barcode, store_id=request.args.get('store_id'), since=since, limit=limit)
+    return jsonify({
+        'success': True,
+        'barcode': barcode,
+        'changes': changes
+    })
+
+@app.route('/stores/stock', methods=['POST'])
+def store_stock():
+    """Mağaza merkezli sorgu: barkod listesinden hangileri bu mağazalarda var
+
+    Yerel ters indeksten (mağaza -> barkod -> adet) cevap verir, upstream'e
+    gitmez. Gövde: store_ids (tercih sırasıyla, varsayılan öncelikli mağaza),
+    barcodes (verilmezse mağazalardaki tüm barkodlar), min_stock (varsayılan 1).
+    Ürünler ilk stoklu mağazanın tercih sırasına, sonra toplam adede göre sıralanır.
+    """
+    data = request.get_json(silent=True) or {}
+    store_ids = data.get('store_ids') or [store_registry.priority_code]
+    barcodes = data.get('barcodes')
+
+    if not isinstance(store_ids, list) or (barcodes is not None and not isinstance(barcodes, list)):
+        return jsonify({
+            'success': False,
+            'error': 'store_ids ve barcodes liste olmalı'
+        }), 400
+
+    store_ids = list(dict.fromkeys(str(s).strip() for s in store_ids if str(s).strip()))
+    if barcodes is not None:
+        barcodes = list(dict.fromkeys(str(b).strip() for b in barcodes if str(b).strip()))
+        if len(barcodes) > BATCH_MAX_ITEMS:
             return jsonify({
                 'success': False,
-                'error': result.get('error', 'Bilinmeyen hata'),
-                'stock_data': [],
-                'variants': [],
-                'debug_info': {
-                    'url': result.get('url')
-                }
-            })
-        
-    except Exception as e:
-        print(f"❌ Endpoint hatası: {e}")
+                'error': f'En fazla {BATCH_MAX_ITEMS} barkod sorgulanabilir'
+            }), 400
+    try:
+        min_units = max(1, int(data.get('min_stock', 1)))
+    except (TypeError, ValueError) as e:
         return jsonify({
             'success': False,
-            'error': f'Sunucu hatası: {str(e)}',
-            'stock_data': [],
-            'variants': []
+            'error': f'Geçersiz parametre: {str(e)}'
+        }), 400
+
+    rows = snapshot_store.store_inventory(store_ids, barcodes, min_units=min_units)
+
+    # Satırları barkod altında topla
+    preference = {store_id: index for index, store_id in enumerate(store_ids)}
+    items = {}
+    for store_id, store, barcode, title, stock, units, checked_at in rows:
+        item = items.setdefault(barcode, {'barcode': barcode, 'title': title, 'total': 0, 'stores': []})
+        item['total'] += units
+        item['stores'].append({
+            'store_id': store_id,
+            'store': store,
+            'stock': stock,
+            'units': units,
+            'checked_at': checked_at
         })
+    for item in items.values():
+        item['stores'].sort(key=lambda entry: preference[entry['store_id']])
+    ranked = sorted(items.values(), key=lambda item: (preference[item['stores'][0]['store_id']], -item['total']))
+
+    payload = {
+        'success': True,
+        'store_ids': store_ids,
+        'items': ranked
+    }
+    if barcodes is not None:
+        known = snapshot_store.known_barcodes(barcodes)
+        # missing: kayıtlı ama bu mağazalarda stoğu yok; unknown: hiç sorgulanmamış
+        payload['missing'] = [b for b in barcodes if b in known and b not in items]
+        payload['unknown'] = [b for b in barcodes if b not in known]
+    return jsonify(payload)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrikleri"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 if __name__ == '__main__':
     # Development için
@@ -0,0 +1,482 @@
+"""Async (ASGI) sunum modu.
+
+POST /search ve GET /search/stream (SSE) asyncio üzerinde httpx.AsyncClient
+ile sunulur; upstream beklerken hiçbir worker thread'i bloklanmaz ve tek
+süreç yüzlerce sorguyu aynı anda bekletebilir. Cevap sözleşmesi senkron
+Flask endpoint'leri ile aynıdır (search_payload/error_payload ve SSE olay
+üreticileri ortak). Diğer tüm route'lar (/,
+static dosyalar, /search/batch) asgiref üzerinden Flask uygulamasına
+devredilir; bu istekler MUDO_WSGI_THREADS boyutlu ayrı bir thread havuzunda
+çalışır, yavaş bir /search/batch ana sayfayı ve static dosyaları bekletmez.
+
+Çalıştırma:
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:5000 asgi:app
+"""
+import asyncio
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import (
+    COMPRESS_MIN_SIZE,
+    app as flask_app,
+    barcode_validator,
+    circuit_open_result,
+    error_payload,
+    cached_stock_result,
+    fetched_stock_result,
+    indexed_stock_result,
+    memoized_stock_result,
+    not_modified_result,
+    page_stream,
+    prefix_result,
+    parse_memo,
+    rate_limited_result,
+    remembered_result,
+    final_search_events,
+    search_payload,
+    sse_event,
+    stage_event,
+    stock_cache,
+    stock_flight,
+    store_result,
+    token_unused,
+    streamed_page_done,
+    upstream,
+    validate_barcode,
+    wants_prefix,
+    PREFETCH_MAX_VARIANTS,
+    PREFETCH_WORKERS,
+    STREAM_CHUNK_SIZE,
+    STREAM_DRAIN_BYTES,
+    STREAM_PARSE,
+)
+from assets import choose_encoding, compress
+from breaker import CircuitOpenError
+from log import fields, logger
+from metrics import SEARCH_IN_FLIGHT, SEARCH_SECONDS, observe_phase, timed
+from ratelimit import BACKGROUND, INTERACTIVE, RateLimitError
+from stock_cache import STALE
+from upstream import STOCK_URL, AsyncUpstreamClient
+
+WSGI_THREADS = int(os.environ.get('MUDO_WSGI_THREADS', 16))
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi; Flask istekleri süreçte tek paylaşılan thread yerine havuzda çalışır
+
+    asgiref run_wsgi_app'i thread_sensitive sync_to_async ile çalıştırır;
+    tüm devredilen route'lar sırayla tek thread'de bekler.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    _run_wsgi_app = inspect.unwrap(WsgiToAsgiInstance.__dict__['run_wsgi_app'])
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self._run_wsgi_app, thread_sensitive=False, executor=self.executor)(body)
+
+
+flask_asgi = PooledWsgiToAsgi(
+    flask_app, ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+)
+
+# Flask'a devredilen /search/batch ile aynı öncelik sırasını ve jeton kovasını kullanır
+async_upstream = AsyncUpstreamClient.from_env(upstream.limiter)
+
+# Arka plan işlerinin (yenileme, ön-yükleme) referansları; GC'ye karşı
+background_tasks = set()
+prefetch_pending = set()
+prefetch_semaphore = None
+
+
+def spawn(coro):
+    """Arka plan görevi başlatır ve bitene kadar referansını tutar"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def scrape_mudo_stock_async(barcode, on_stage=None, priority=INTERACTIVE):
+    """scrape_mudo_stock'un async karşılığı"""
+    url = STOCK_URL.format(barcode=barcode)
+    try:
+        response = await async_upstream.get(url, priority=priority, stream=STREAM_PARSE,
+                                            headers=parse_memo.conditional_headers(url))
+        if response.status_code == 304:
+            await response.aclose()
+            result = not_modified_result(url, on_stage)
+            if result is not None:
+                return result
+            response = await async_upstream.get(url, priority=BACKGROUND if priority is None else priority,
+                                                stream=STREAM_PARSE)
+        try:
+            response.raise_for_status()
+            if STREAM_PARSE:
+                return await streamed_stock_result_async(url, response, on_stage)
+            # Özet ve parse CPU işi; event loop'u bloklamamak için thread'de
+            return await asyncio.to_thread(memoized_stock_result, url, response, on_stage)
+        finally:
+            await response.aclose()
+
+    except CircuitOpenError as e:
+        return circuit_open_result(e, url)
+    except RateLimitError as e:
+        return rate_limited_result(e, url)
+    except httpx.HTTPError as e:
+        logger.warning("HTTP isteği hatası", extra=fields(barcode=barcode, error=str(e)))
+        return {
+            'success': False,
+            'error': f'HTTP isteği başarısız: {str(e)}',
+            'url': url
+        }
+    except Exception as e:
+        logger.exception("Genel hata", extra=fields(barcode=barcode))
+        return {
+            'success': False,
+            'error': f'Beklenmeyen hata: {str(e)}',
+            'url': url
+        }
+
+
+async def streamed_stock_result_async(url, response, on_stage=None):
+    """streamed_stock_result'un async karşılığı
+
+    Parçalar indirildikçe thread'de özete ve indekse beslenir; event loop
+    sadece indirmeyi bekler.
+    """
+    chunks = response.aiter_bytes(STREAM_CHUNK_SIZE)
+    download_seconds = parse_seconds = 0.0
+
+    prefix = parse_memo.stream_prefix(url)
+    buffered = []
+    size = 0
+    while wants_prefix(prefix, size):
+        start = time.perf_counter()
+        chunk = await anext(chunks, None)
+        download_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        buffered.append(chunk)
+        size += len(chunk)
+    if prefix is not None:
+        result = await asyncio.to_thread(prefix_result, url, prefix, buffered, response, on_stage)
+        if result is not None:
+            observe_phase('upstream_download', download_seconds)
+            if prefix[1]:
+                await drain_async(chunks)
+            return result
+
+    stream = page_stream(response)
+    hasher = parse_memo.hasher()
+    pending = iter(buffered)
+    while True:
+        start = time.perf_counter()
+        chunk = next(pending, None) or await anext(chunks, None)
+        download_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        complete, seconds = await asyncio.to_thread(feed_chunk, stream, hasher, chunk)
+        parse_seconds += seconds
+        if complete:
+            break
+    doc, seconds = await asyncio.to_thread(close_stream, stream)
+    parse_seconds += seconds
+    streamed_page_done(stream, download_seconds, parse_seconds)
+
+    digest = hasher.hexdigest()
+    result = await asyncio.to_thread(
+        remembered_result, url, digest, response.headers,
+        lambda: indexed_stock_result(doc, url, on_stage), on_stage
+    )
+    parse_memo.remember_prefix(url, stream.bytes_fed, stream.complete, digest)
+    if stream.complete:
+        result['partial'] = True
+        await drain_async(chunks)
+    return result
+
+
+def feed_chunk(stream, hasher, chunk):
+    """Parçayı özete ve akışlı indekse besler; (tamamlandı mı, parse süresi)"""
+    hasher.update(chunk)
+    start = time.perf_counter()
+    complete = stream.feed(chunk)
+    return complete, time.perf_counter() - start
+
+
+def close_stream(stream):
+    """Akışlı indeksi kapatır; (indeks, parse süresi)"""
+    start = time.perf_counter()
+    doc = stream.close()
+    return doc, time.perf_counter() - start
+
+
+async def drain_async(chunks):
+    """drain'in async karşılığı"""
+    drained = 0
+    async for chunk in chunks:
+        drained += len(chunk)
+        if drained > STREAM_DRAIN_BYTES:
+            break
+
+
+async def fetch_stock_async(barcode, on_stage=None, priority=INTERACTIVE):
+    result = await scrape_mudo_stock_async(barcode, on_stage, priority)
+    await asyncio.to_thread(store_result, barcode, result)
+    return result
+
+
+async def prepaid_fetch_async(barcode, priority):
+    """prepaid_fetch'in async karşılığı"""
+    url = STOCK_URL.format(barcode=barcode)
+    try:
+        await async_upstream.reserve_async(priority)
+    except CircuitOpenError as e:
+        return circuit_open_result(e, url), False
+    except RateLimitError as e:
+        return rate_limited_result(e, url), False
+    result, shared = await stock_flight.do_async(barcode, lambda: fetch_stock_async(barcode, priority=None))
+    if token_unused(result, shared):
+        await asyncio.to_thread(async_upstream.limiter.refund)
+    return result, shared
+
+
+async def get_stock_result_async(barcode, on_stage=None):
+    """get_stock_result'un async karşılığı; (sonuç, cache durumu) döndürür
+
+    SQLite cache ve sıcak barkod sayacı thread'de okunup yazılır.
+    """
+    cached = await asyncio.to_thread(cached_stock_result, barcode)
+    if cached is not None:
+        result, state, refresh = cached
+        if refresh:
+            spawn(prepaid_fetch_async(barcode, BACKGROUND))
+        return result, state
+
+    result, shared = await stock_flight.do_async(barcode, lambda: fetch_stock_async(barcode, on_stage))
+    return await asyncio.to_thread(fetched_stock_result, barcode, result, shared)
+
+
+async def prefetch_stock_async(barcode):
+    global prefetch_semaphore
+    if prefetch_semaphore is None:
+        prefetch_semaphore = asyncio.Semaphore(PREFETCH_WORKERS)
+    try:
+        async with prefetch_semaphore:
+            cached = await asyncio.to_thread(stock_cache.get, barcode)
+            if cached is None or cached[1] == STALE:
+                await prepaid_fetch_async(barcode, BACKGROUND)
+    except Exception as e:
+        logger.warning("Varyant ön-yükleme hatası", extra=fields(barcode=barcode, error=str(e)))
+    finally:
+        prefetch_pending.discard(barcode)
+
+
+def prefetch_variants_async(barcode, variants):
+    for variant in variants[:PREFETCH_MAX_VARIANTS]:
+        variant_barcode = variant.get('barcode')
+        if (not variant_barcode or variant_barcode == barcode or variant_barcode in prefetch_pending
+                or not barcode_validator.is_valid(variant_barcode)):
+            continue
+        prefetch_pending.add(variant_barcode)
+        spawn(prefetch_stock_async(variant_barcode))
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+
+def header(scope, name):
+    """İstek başlığının değeri (küçük harf adla); yoksa None"""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def send_json(scope, send, payload, status=200):
+    # Flask jsonify ile aynı serileştirme ve sıkıştırma (compress_json)
+    with timed('serialize'):
+        body = f"{flask_app.json.dumps(payload)}\n".encode('utf-8')
+    headers = [(b'content-type', b'application/json')]
+    if len(body) >= COMPRESS_MIN_SIZE:
+        headers.append((b'vary', b'Accept-Encoding'))
+        encoding = choose_encoding(header(scope, b'accept-encoding'))
+        if encoding:
+            with timed('compress'):
+                body = compress(body, encoding)
+            headers.append((b'content-encoding', encoding.encode('ascii')))
+    headers.append((b'content-length', str(len(body)).encode('ascii')))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def search(scope, receive, send):
+    """Async stok sorgulama endpoint'i (Flask /search ile aynı sözleşme)"""
+    start = time.perf_counter()
+    SEARCH_IN_FLIGHT.inc()
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+            barcode = data.get('barcode')
+
+            if not barcode:
+                await send_json(scope, send, error_payload('Barkod numarası gerekli'))
+                return
+
+            barcode, invalid = validate_barcode(barcode)
+            if invalid is not None:
+                await send_json(scope, send, invalid)
+                return
+
+            result, cache_state = await get_stock_result_async(barcode)
+            payload = search_payload(result, cache_state)
+
+        except Exception as e:
+            logger.exception("Endpoint hatası")
+            await send_json(scope, send, error_payload(f'Sunucu hatası: {str(e)}'))
+            return
+
+        await send_json(scope, send, payload)
+        SEARCH_SECONDS.labels(cache_state).observe(time.perf_counter() - start)
+    finally:
+        SEARCH_IN_FLIGHT.dec()
+
+    # Cevap gönderildikten sonra diğer varyantları arka planda ön-yükle
+    if payload['variants'] and PREFETCH_MAX_VARIANTS > 0:
+        prefetch_variants_async(barcode, payload['variants'])
+
+
+async def iter_search_events_async(barcode):
+    """iter_search_events'in async karşılığı"""
+    loop = asyncio.get_running_loop()
+    stages = asyncio.Queue()
+
+    # build_stock_result thread'de çalışır; aşamalar event loop'a aktarılır
+    def on_stage(stage, value):
+        loop.call_soon_threadsafe(stages.put_nowait, (stage, value))
+
+    # İstemci akışı yarıda keserse sorgu tamamlanıp cache'e yazılsın diye spawn
+    lookup = spawn(get_stock_result_async(barcode, on_stage))
+    sent = set()
+    while not lookup.done():
+        getter = asyncio.ensure_future(stages.get())
+        await asyncio.wait({getter, lookup}, return_when=asyncio.FIRST_COMPLETED)
+        if not getter.done():
+            getter.cancel()
+            break
+        stage, value = getter.result()
+        sent.add(stage)
+        yield stage_event(stage, value)
+
+    while not stages.empty():
+        stage, value = stages.get_nowait()
+        sent.add(stage)
+        yield stage_event(stage, value)
+
+    try:
+        result, cache_state = await lookup
+    except Exception as e:
+        logger.exception("Akış sorgusu hatası", extra=fields(barcode=barcode))
+        yield 'error', error_payload(f'Sunucu hatası: {str(e)}')
+        return
+    for event in final_search_events(result, cache_state, sent):
+        yield event
+
+
+async def search_stream(scope, receive, send):
+    """Async SSE akışı (Flask /search/stream ile aynı olaylar)"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    barcode = query.get('barcode', [''])[0].strip()
+    invalid = None
+    if barcode:
+        barcode, invalid = validate_barcode(barcode)
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    async def send_event(event, data):
+        await send({
+            'type': 'http.response.body',
+            'body': sse_event(event, data).encode('utf-8'),
+            'more_body': True,
+        })
+
+    variants = []
+    if invalid is not None:
+        await send_event('error', invalid)
+    elif not barcode:
+        await send_event('error', error_payload('Barkod numarası gerekli'))
+    else:
+        start = time.perf_counter()
+        SEARCH_IN_FLIGHT.inc()
+        try:
+            async for event, data in iter_search_events_async(barcode):
+                if event == 'variants':
+                    variants = data['variants']
+                await send_event(event, data)
+                if event == 'done':
+                    SEARCH_SECONDS.labels(data['debug_info']['cache']).observe(time.perf_counter() - start)
+        finally:
+            SEARCH_IN_FLIGHT.dec()
+    await send({'type': 'http.response.body', 'body': b''})
+
+    if variants and PREFETCH_MAX_VARIANTS > 0:
+        prefetch_variants_async(barcode, variants)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_upstream.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI giriş noktası"""
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/search' and scope['method'] == 'POST':
+        await search(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/search/stream' and scope['method'] == 'GET':
+        await search_stream(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
@@ -0,0 +1,127 @@
+"""Bellekte tutulan, önceden sıkıştırılmış statik dosyalar ve içerik kodlaması.
+
+index.html ve kök dizindeki .css/.js/.ico dosyaları uygulama açılırken bir
+kez okunur, gzip (brotli paketi kuruluysa br) ile sıkıştırılır ve her
+kodlama için ayrı güçlü bir ETag hesaplanır. index.html içindeki dosya
+referansları içerik özetli adlarla değiştirilir (style.css ->
+style.3f2a9c1e.css); özetli adlar değişmeyeceği için bir yıl, immutable
+olarak cache'lenir. index.html ve özetsiz adlar her seferinde ETag ile
+doğrulanır (If-None-Match -> 304).
+
+choose_encoding/compress aynı pazarlığı /search JSON cevapları için de sağlar.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli isteğe bağlı; yoksa sadece gzip
+    brotli = None
+
+INDEX = 'index.html'
+ASSET_EXTENSIONS = ('.css', '.js', '.ico')
+
+# Tercih sırası; brotli yoksa listeden düşer
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+def compress(body, encoding, static=False):
+    """Gövdeyi verilen kodlamayla sıkıştırır; static ise en yüksek seviyede"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if static else 5)
+    return gzip.compress(body, compresslevel=9 if static else 6, mtime=0)
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """Accept-Encoding başlığına göre kullanılacak kodlama; yoksa None"""
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+class Asset:
+    """Bir dosyanın ham ve sıkıştırılmış halleri"""
+
+    def __init__(self, name, body, content_type):
+        self.name = name
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        root, ext = os.path.splitext(name)
+        self.hashed_name = f"{root}.{self.digest[:8]}{ext}"
+        self.bodies = {None: body}
+        for encoding in ENCODINGS:
+            compressed = compress(body, encoding, static=True)
+            if len(compressed) < len(body):
+                self.bodies[encoding] = compressed
+
+    def etag(self, encoding):
+        return self.digest if encoding is None else f"{self.digest}-{encoding}"
+
+    def variant(self, accept_encoding):
+        """(kodlama, gövde, etag) üçlüsü"""
+        encoding = choose_encoding(accept_encoding, [e for e in ENCODINGS if e in self.bodies])
+        return encoding, self.bodies[encoding], self.etag(encoding)
+
+    def etags(self):
+        return [self.etag(encoding) for encoding in self.bodies]
+
+
+class AssetStore:
+    """Uygulama açılışında yüklenen statik dosyalar"""
+
+    def __init__(self, root):
+        self.root = root
+        self._assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith(ASSET_EXTENSIONS) and os.path.isfile(os.path.join(self.root, name)):
+                assets[name] = self._read(name)
+
+        # index.html, diğer dosyaların özetli adlarına referans verecek şekilde
+        with open(os.path.join(self.root, INDEX), 'r', encoding='utf-8') as f:
+            html = f.read()
+        for asset in assets.values():
+            html = html.replace(f'"{asset.name}"', f'"{asset.hashed_name}"')
+        index = Asset(INDEX, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+        self._assets = {INDEX: index}
+        for asset in assets.values():
+            self._assets[asset.name] = asset
+            self._assets[asset.hashed_name] = asset
+
+    def _read(self, name):
+        with open(os.path.join(self.root, name), 'rb') as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        return Asset(name, body, content_type)
+
+    def get(self, name):
+        """(asset, immutable mi) döndürür; bilinmeyen adda None"""
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        return asset, name == asset.hashed_name
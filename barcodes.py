@@ -0,0 +1,86 @@
+"""Upstream'e gitmeden önce barkodun yerel doğrulaması.
+
+Yanlış yazılmış veya yanlış okunmuş barkod upstream'de ancak tam bir
+sorgu (15 saniyeye kadar) sonunda "bulunamadı" sayfası verir. Biçimi ve
+kontrol hanesi tutmayan kodlar burada anında reddedilir.
+
+Kabul edilen biçimler:
+- GTIN: 8 (EAN-8), 12 (UPC-A), 13 (EAN-13) veya 14 haneli, kontrol hanesi doğru
+- Mudo ürün kodu: 123-4-567-89-012
+- MUDO_BARCODE_EXTRA_PATTERN ile verilen ek biçim (tam eşleşme)
+"""
+import os
+import re
+
+GTIN_LENGTHS = frozenset([8, 12, 13, 14])
+GTIN_RE = re.compile(r'[0-9]+')
+PRODUCT_CODE_RE = re.compile(r'\d{3}-\d-\d{3}-\d{2}-\d{3}', re.ASCII)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class InvalidBarcodeError(ValueError):
+    """Barkod yerel doğrulamadan geçmedi; reason: format veya checksum"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def check_digit(body):
+    """Kontrol hanesi hariç GTIN gövdesinin kontrol hanesi (sağdan 3, 1, 3, ... ağırlıklı)"""
+    total = sum(int(digit) * (3 if index % 2 == 0 else 1) for index, digit in enumerate(reversed(body)))
+    return (10 - total % 10) % 10
+
+
+def is_gtin(code):
+    """Kabul edilen uzunlukta ve kontrol hanesi doğru GTIN mi
+
+    stock_parser varyant barkodlarını da bu kuralla seçer; sayfadaki
+    varyantlar /search'te reddedilmez.
+    """
+    return (GTIN_RE.fullmatch(code) is not None and len(code) in GTIN_LENGTHS
+            and check_digit(code[:-1]) == int(code[-1]))
+
+
+class BarcodeValidator:
+    """Barkod biçimi ve GTIN kontrol hanesi denetimi"""
+
+    def __init__(self, enabled=True, extra_pattern=None):
+        self.enabled = enabled
+        self.extra_pattern = re.compile(extra_pattern) if extra_pattern else None
+
+    @classmethod
+    def from_env(cls):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(
+            enabled=os.environ.get('MUDO_BARCODE_VALIDATION', '1') != '0',
+            extra_pattern=os.environ.get('MUDO_BARCODE_EXTRA_PATTERN') or None,
+        )
+
+    def is_valid(self, raw):
+        """normalize() hata vermeden geçiyor mu"""
+        try:
+            self.normalize(raw)
+        except InvalidBarcodeError:
+            return False
+        return True
+
+    def normalize(self, raw):
+        """Boşlukları atılmış barkodu döndürür; geçersizse InvalidBarcodeError"""
+        barcode = WHITESPACE_RE.sub('', str(raw))
+        if not self.enabled:
+            return barcode
+        if self.extra_pattern is not None and self.extra_pattern.fullmatch(barcode):
+            return barcode
+        if PRODUCT_CODE_RE.fullmatch(barcode):
+            return barcode
+        if GTIN_RE.fullmatch(barcode) and len(barcode) in GTIN_LENGTHS:
+            if check_digit(barcode[:-1]) != int(barcode[-1]):
+                raise InvalidBarcodeError(
+                    f'Geçersiz barkod: {barcode} kontrol hanesi tutmuyor, barkodu tekrar okutun', 'checksum'
+                )
+            return barcode
+        raise InvalidBarcodeError(
+            'Geçersiz barkod: 8, 12, 13 veya 14 haneli EAN/UPC barkodu ya da 123-4-567-89-012 biçiminde ürün kodu girin',
+            'format'
+        )
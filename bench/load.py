@@ -0,0 +1,207 @@
+"""/search için uçtan uca yük testi.
+
+--target verilmezse yerel stub upstream'i ve Dockerfile'daki gunicorn
+yapılandırmasını (4 worker, timeout 120, gunicorn.conf.py) geçici cache
+dosyalarıyla başlatır. Ardından --concurrency kadar istemci thread'i
+--duration boyunca POST /search gönderir (kapalı döngü: her thread cevabı
+alınca sıradakini yollar). Sonuçta p50/p95/p99 gecikme, saniyedeki istek
+ve cache durumu dağılımı raporlanır.
+
+Kullanım:
+    python bench/load.py --concurrency 32 --duration 30 --barcodes 500 --latency 0.3
+    python bench/load.py --asgi --concurrency 200 --latency 1.0
+    python bench/load.py --target http://staging:5000 --duration 60
+
+--barcodes küçüldükçe cache isabet oranı artar; --cache-ttl 0 (bayat
+süre de 0 olur) her isteği upstream'e (stub'a) gönderir.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from stub_upstream import add_arguments, config_from_args, start_in_thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from barcodes import check_digit  # noqa: E402
+
+
+def percentile(samples, q):
+    """Sıralı örneklerde en yakın sıra (nearest-rank) yüzdeliği"""
+    index = max(0, min(len(samples) - 1, int(round(q / 100 * len(samples))) - 1))
+    return samples[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, upstream_url, workdir):
+    """gunicorn'u Dockerfile CMD'si ile aynı ayarlarla başlatır; (süreç, adres) döndürür"""
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--timeout', '120']
+    if args.asgi:
+        command += ['-k', 'uvicorn.workers.UvicornWorker', 'asgi:app']
+    else:
+        command += ['app:app']
+
+    metrics_dir = os.path.join(workdir, 'metrics')
+    os.makedirs(metrics_dir)
+    env = dict(
+        os.environ,
+        MUDO_UPSTREAM_URL=upstream_url,
+        MUDO_CACHE_PATH=os.path.join(workdir, 'cache.sqlite3'),
+        MUDO_SNAPSHOT_PATH=os.path.join(workdir, 'snapshots.sqlite3'),
+        PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+        MUDO_LOG_LEVEL=os.environ.get('MUDO_LOG_LEVEL', 'WARNING'),
+        MUDO_RATE_LIMIT_RATE=str(args.rate_limit),
+    )
+    if args.cache_ttl is not None:
+        env['MUDO_CACHE_TTL'] = str(args.cache_ttl)
+        if args.cache_ttl == 0:
+            env['MUDO_CACHE_STALE_TTL'] = '0'
+
+    # gunicorn.conf.py çalışma dizininden otomatik okunur
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn başlatılamadı (çıkış kodu {process.returncode})')
+        try:
+            requests.get(f'{base_url}/metrics', timeout=1)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn 30 saniyede hazır olmadı')
+
+
+def make_barcodes(count, seed=42):
+    """Kontrol hanesi geçerli EAN-13 barkodları (yerel doğrulamadan geçer)"""
+    rng = random.Random(seed)
+    bodies = [f'8682{rng.randrange(10 ** 7, 10 ** 8)}' for _ in range(count)]
+    return [f'{body}{check_digit(body)}' for body in bodies]
+
+
+def run_load(base_url, barcodes, concurrency, duration, timeout):
+    """Kapalı döngü yük; [(saniye, http durum, başarılı mı, cache durumu)] döndürür"""
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            barcode = rng.choice(barcodes)
+            start = time.perf_counter()
+            try:
+                response = session.post(f'{base_url}/search', json={'barcode': barcode}, timeout=timeout)
+                data = response.json()
+                local.append((time.perf_counter() - start, response.status_code, data.get('success', False),
+                              data.get('debug_info', {}).get('cache', '-')))
+            except (requests.exceptions.RequestException, ValueError):
+                local.append((time.perf_counter() - start, 0, False, '-'))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def report(samples, duration):
+    latencies = sorted(sample[0] for sample in samples)
+    failed = sum(1 for sample in samples if not sample[2])
+    cache_states = Counter(sample[3] for sample in samples if sample[2])
+    summary = {
+        'requests': len(samples),
+        'rps': len(samples) / duration,
+        'failed': failed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'cache': dict(cache_states),
+    }
+    print(f"İstek: {summary['requests']}  RPS: {summary['rps']:.1f}  Başarısız: {failed}")
+    print(f"Gecikme ms  p50: {summary['p50_ms']:.1f}  p95: {summary['p95_ms']:.1f}  "
+          f"p99: {summary['p99_ms']:.1f}  max: {summary['max_ms']:.1f}")
+    print('Cache: ' + '  '.join(f'{state}={count}' for state, count in cache_states.most_common()))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/search uçtan uca yük testi')
+    parser.add_argument('--target', help='Çalışan sunucu adresi; verilmezse stub + gunicorn başlatılır')
+    parser.add_argument('--concurrency', type=int, default=16, help='Eşzamanlı istemci sayısı')
+    parser.add_argument('--duration', type=float, default=20, help='Ölçüm süresi (saniye)')
+    parser.add_argument('--warmup', type=float, default=3, help='Ölçülmeyen ısınma süresi (saniye)')
+    parser.add_argument('--barcodes', type=int, default=200, help='Sorgulanan farklı barkod sayısı')
+    parser.add_argument('--request-timeout', type=float, default=60, help='İstemci timeout\'u (saniye)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker sayısı (Dockerfile: 4)')
+    parser.add_argument('--asgi', action='store_true', help='UvicornWorker ile asgi:app çalıştır')
+    parser.add_argument('--cache-ttl', type=float, help='MUDO_CACHE_TTL (0: cache\'i devre dışı bırak)')
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='MUDO_RATE_LIMIT_RATE (varsayılan 0: stub\'a hız sınırı uygulanmaz)')
+    parser.add_argument('--json', help='Özeti JSON olarak bu dosyaya yaz')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    process = stub = workdir = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            stub_config = config_from_args(args)
+            stub, upstream_url = start_in_thread(stub_config)
+            workdir = tempfile.mkdtemp(prefix='mudo-bench-')
+            process, base_url = start_server(args, upstream_url, workdir)
+
+        barcodes = make_barcodes(args.barcodes)
+        if args.warmup > 0:
+            run_load(base_url, barcodes, args.concurrency, args.warmup, args.request_timeout)
+        started = time.monotonic()
+        samples = run_load(base_url, barcodes, args.concurrency, args.duration, args.request_timeout)
+        elapsed = time.monotonic() - started
+        if not samples:
+            raise SystemExit('Hiç istek tamamlanmadı')
+
+        summary = report(samples, elapsed)
+        if stub is not None:
+            print(f"Stub upstream isteği: {stub.config.requests}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if stub is not None:
+            stub.shutdown()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Parse motoru mikro benchmark'ı (ağ ve Flask olmadan).
+
+Her fixture için build_index (lxml indeksleme), extract_stock_page,
+filter_stock_data ve hepsini kapsayan build_stock_result ayrı ayrı ölçülür.
+stream_index, gövdeyi 16 KB'lık parçalarla StockPageStream'e besler ve
+erken durma noktasına kadar indekslemenin süresini verir.
+
+Her fixture için sonuç kontrolü de yapılır: akışlı parse (erken durmadan)
+sonucu tam parse ile birebir aynı olmalıdır, değilse çıkış kodu 1 olur.
+Erken durmalı sonuçtaki farklar raporlanır; MUDO_STREAM_PARSE=1 ile
+çalıştırılırsa bu farklar da hata sayılır. Akışlı parse'ı açmadan önce
+gerçek sayfalar fixture olarak eklenip bu kontrol çalıştırılmalıdır.
+
+Kullanım:
+    python bench/parser_bench.py
+    python bench/parser_bench.py --save bench/baseline.json
+    python bench/parser_bench.py --baseline bench/baseline.json --tolerance 0.2
+
+--baseline verilirse build_stock_result medyanı baseline'dan tolerance
+oranından fazla yavaşlayan fixture'lar raporlanır ve çıkış kodu 1 olur.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app import'unun yan etkileri (cache/geçmiş dosyaları) geçici dizinde kalsın
+os.environ.setdefault('MUDO_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'mudo_bench_cache.sqlite3'))
+os.environ.setdefault('MUDO_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'mudo_bench_snapshots.sqlite3'))
+os.environ.setdefault('MUDO_LOG_LEVEL', 'WARNING')
+
+from app import (  # noqa: E402
+    STREAM_CHUNK_SIZE,
+    STREAM_PARSE,
+    build_stock_result,
+    filter_stock_data,
+    indexed_stock_result,
+    is_store_row,
+)
+from stock_parser import StockPageStream, build_index, extract_stock_page  # noqa: E402
+from stub_upstream import FIXTURES_DIR, load_fixtures  # noqa: E402
+
+
+def percentile(samples, q):
+    """Sıralı örneklerde en yakın sıra (nearest-rank) yüzdeliği"""
+    index = max(0, min(len(samples) - 1, int(round(q / 100 * len(samples))) - 1))
+    return samples[index]
+
+
+def measure(fn, repeat, prepare=None):
+    """fn'i repeat kez çalıştırır; sıralı süreler (saniye)"""
+    samples = []
+    for _ in range(repeat):
+        arg = prepare() if prepare else None
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
+
+
+def stream_index(body, early_exit=True):
+    """Gövdeyi parça parça besler; erken durursa kalan parçalar okunmaz"""
+    stream = StockPageStream('utf-8', is_store_row if early_exit else None)
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        if stream.feed(body[start:start + STREAM_CHUNK_SIZE]):
+            break
+    return stream.close()
+
+
+def result_diff(expected, actual):
+    """İki sonuçta farklı olan alanlar"""
+    return sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+
+
+def check_fixture(html):
+    """Tam parse'a göre (akışlı, erken durmalı) sonuç farkları"""
+    body = html.encode('utf-8')
+    expected = build_stock_result(html, 'bench')
+    return (
+        result_diff(expected, indexed_stock_result(stream_index(body, early_exit=False), 'bench')),
+        result_diff(expected, indexed_stock_result(stream_index(body), 'bench')),
+    )
+
+
+def bench_fixture(html, repeat):
+    body = html.encode('utf-8')
+    doc = build_index(html)
+    raw_stock = extract_stock_page(doc)['stock_data']
+    stages = {
+        'build_index': measure(lambda _: build_index(html), repeat),
+        'extract_stock_page': measure(lambda _: extract_stock_page(doc), repeat),
+        # filter_stock_data satırları değiştirir; her tur kopyası verilir
+        'filter_stock_data': measure(filter_stock_data, repeat,
+                                     prepare=lambda: [dict(item) for item in raw_stock]),
+        'build_stock_result': measure(lambda _: build_stock_result(html, 'bench'), repeat),
+        'stream_index': measure(lambda _: stream_index(body), repeat),
+    }
+    return {
+        stage: {
+            'median_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+        }
+        for stage, samples in stages.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse motoru mikro benchmark\'ı')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='HTML fixture dizini')
+    parser.add_argument('--repeat', type=int, default=200, help='Fixture başına tekrar sayısı')
+    parser.add_argument('--save', help='Sonuçları JSON olarak bu dosyaya yaz')
+    parser.add_argument('--baseline', help='Karşılaştırılacak önceki --save çıktısı')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='İzin verilen yavaşlama oranı')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    failures = []
+    print('Sonuç kontrolü (tam parse ile karşılaştırma)')
+    for name, body in fixtures.items():
+        stream_diff, early_exit_diff = check_fixture(body.decode('utf-8'))
+        print(f"{name:<12} akışlı: {', '.join(stream_diff) or 'aynı'}  "
+              f"erken durmalı: {', '.join(early_exit_diff) or 'aynı'}")
+        if stream_diff or (STREAM_PARSE and early_exit_diff):
+            failures.append(name)
+    print()
+
+    results = {}
+    print(f"{'fixture':<12} {'KB':>6}  {'aşama':<20} {'medyan ms':>10} {'p95 ms':>8}")
+    for name, body in fixtures.items():
+        html = body.decode('utf-8')
+        build_stock_result(html, 'bench')  # ısınma
+        results[name] = bench_fixture(html, args.repeat)
+        for stage, stats in results[name].items():
+            print(f"{name:<12} {len(body) / 1024:>6.1f}  {stage:<20} "
+                  f"{stats['median_ms']:>10.3f} {stats['p95_ms']:>8.3f}")
+        total = results[name]['build_stock_result']['median_ms']
+        print(f"{name:<12} {'':>6}  {'sayfa/sn':<20} {1000 / total:>10.0f}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, stages in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]['build_stock_result']['median_ms']
+            after = stages['build_stock_result']['median_ms']
+            change = after / before - 1
+            print(f"{name:<12} baseline {before:.3f} ms -> {after:.3f} ms ({change:+.1%})")
+            if change > args.tolerance:
+                regressions.append(name)
+        if regressions:
+            print(f"Performans gerilemesi: {', '.join(regressions)}")
+            sys.exit(1)
+
+    if failures:
+        print(f"Sonuç tam parse'tan farklı: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
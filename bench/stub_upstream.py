@@ -0,0 +1,192 @@
+"""Benchmark ve yük testleri için yerel StokSorgula stub'ı.
+
+bench/fixtures altındaki HTML sayfalarını gerçek upstream gibi sunar;
+gecikme ve hata enjekte edilebilir. Barkoda ait <barkod>.html varsa o
+sayfa, yoksa barkodun özetine göre fixture'lardan biri döner (aynı barkod
+her zaman aynı sayfayı alır). --etag ile ETag gönderir ve If-None-Match
+eşleşirse 304 döner.
+
+Kullanım:
+    python bench/stub_upstream.py --port 8099 --latency 0.3 --jitter 0.1 --error-rate 0.02
+    MUDO_UPSTREAM_URL='http://127.0.0.1:8099/StokSorgula/StokSorgula?kod={barcode}' gunicorn app:app
+
+Gerçek bir sayfayı fixture olarak kaydetmek için:
+    curl -o bench/fixtures/<barkod>.html 'http://mudonetapps.mudo.com.tr/StokSorgula/StokSorgula?kod=<barkod>'
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixtures(path=FIXTURES_DIR):
+    """{ad: gövde} sözlüğü (ad = uzantısız dosya adı)"""
+    fixtures = {}
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.html'):
+            with open(os.path.join(path, name), 'rb') as f:
+                fixtures[name[:-5]] = f.read()
+    return fixtures
+
+
+class StubConfig:
+    """Stub davranışı; çalışırken değiştirilebilir"""
+
+    def __init__(self, fixtures, latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0,
+                 hang=30.0, reset_rate=0.0, use_gzip=False, fixture=None, etag=False):
+        self.fixtures = fixtures
+        self.names = sorted(fixtures)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.reset_rate = reset_rate
+        self.use_gzip = use_gzip
+        self.fixture = fixture
+        self.etag = etag
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def page(self, barcode):
+        if self.fixture:
+            return self.fixtures[self.fixture]
+        if barcode in self.fixtures:
+            return self.fixtures[barcode]
+        return self.fixtures[self.names[zlib.crc32(barcode.encode()) % len(self.names)]]
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive; istemci havuzu gerçekçi çalışsın
+
+    def do_GET(self):
+        config = self.server.config
+        config.count()
+        roll = random.random()
+
+        # Bağlantıyı cevap vermeden kapat (connection reset)
+        if roll < config.reset_rate:
+            self.close_connection = True
+            return
+        roll -= config.reset_rate
+
+        # Cevabı read timeout'tan uzun beklet
+        if roll < config.timeout_rate:
+            time.sleep(config.hang)
+        roll -= config.timeout_rate
+
+        time.sleep(config.delay())
+
+        if roll < config.error_rate:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        barcode = parse_qs(urlsplit(self.path).query).get('kod', [''])[0]
+        body = config.page(barcode)
+        if config.etag:
+            etag = f'"{zlib.crc32(body):08x}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if config.etag:
+            self.send_header('ETag', etag)
+        if config.use_gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # İstemcinin kapattığı keep-alive bağlantıları gürültü yapmasın
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """Stub sunucusunu oluşturur (port=0 boş bir port seçer)"""
+    server = StubServer((host, port), StubHandler)
+    server.config = config
+    return server
+
+
+def start_in_thread(config, host='127.0.0.1', port=0):
+    """Stub'ı arka plan thread'inde başlatır; (sunucu, MUDO_UPSTREAM_URL) döndürür"""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name='stub-upstream', daemon=True).start()
+    url = f'http://{host}:{server.server_address[1]}/StokSorgula/StokSorgula?kod={{barcode}}'
+    return server, url
+
+
+def add_arguments(parser):
+    """Stub seçeneklerini (load.py ile ortak) argparse'a ekler"""
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='HTML fixture dizini')
+    parser.add_argument('--fixture', help='Her barkod için bu fixture (ör. large)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Ortalama upstream gecikmesi (saniye)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Gecikmenin standart sapması (saniye)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503 dönen isteklerin oranı')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='--hang kadar bekletilen isteklerin oranı')
+    parser.add_argument('--hang', type=float, default=30.0, help='Timeout enjeksiyonunda bekleme (saniye)')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='Cevapsız kapatılan bağlantıların oranı')
+    parser.add_argument('--gzip', action='store_true', help='Accept-Encoding: gzip ise sıkıştırarak gönder')
+    parser.add_argument('--etag', action='store_true', help='ETag gönder, If-None-Match eşleşirse 304 dön')
+
+
+def config_from_args(args):
+    fixtures = load_fixtures(args.fixtures)
+    if args.fixture and args.fixture not in fixtures:
+        raise SystemExit(f'Fixture bulunamadı: {args.fixture} (mevcut: {", ".join(sorted(fixtures))})')
+    return StubConfig(
+        fixtures, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, hang=args.hang, reset_rate=args.reset_rate,
+        use_gzip=args.gzip, fixture=args.fixture, etag=args.etag,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Yerel StokSorgula stub sunucusu')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(config_from_args(args), args.host, args.port)
+    print(f"Stub upstream: http://{args.host}:{args.port}/StokSorgula/StokSorgula?kod={{barcode}}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Toplam istek: {server.config.requests}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Upstream için devre kesici (circuit breaker) ve uyarlamalı read timeout.
+
+CircuitBreaker son `window` saniyedeki çağrıların hata ve yavaşlık oranını
+izler. Yeterli çağrı varken oranlardan biri eşiği aşarsa devre açılır ve
+open_seconds boyunca upstream'e hiç gidilmeden CircuitOpenError yükseltilir;
+worker'lar 15 saniyelik timeout'ları beklemek yerine hemen cevap döner. Süre
+dolunca tek bir deneme çağrısına izin verilir (half-open): başarılıysa devre
+kapanır, değilse tekrar açılır.
+
+AdaptiveTimeout upstream'in son TTFB ölçümlerinin p95'ini tutar; read
+timeout p95 * multiplier olur ve [min_timeout, max_timeout] aralığında
+sınırlanır. Timeout'a düşen çağrılar da süreleriyle örneğe eklenir, böylece
+upstream yavaşladığında timeout kendiliğinden büyür.
+
+Durum worker süreci başınadır; her worker kendi gözlemleriyle karar verir.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from log import fields, logger
+from metrics import UPSTREAM_CIRCUIT_STATE
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# mudo_upstream_circuit_state gauge değerleri
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Devre açıkken upstream çağrısı yapılmadan yükseltilir"""
+
+
+class CircuitBreaker:
+    """Kayan pencerede hata/yavaşlık oranına göre açılan devre kesici"""
+
+    def __init__(self, window=30, min_calls=10, failure_ratio=0.5, slow_call_seconds=5,
+                 slow_call_ratio=0.8, open_seconds=15):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_ratio = slow_call_ratio
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._calls = deque()  # (zaman, başarılı mı, yavaş mı)
+        self._opened_at = 0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(
+            window=float(os.environ.get('MUDO_BREAKER_WINDOW', 30)),
+            min_calls=int(os.environ.get('MUDO_BREAKER_MIN_CALLS', 10)),
+            failure_ratio=float(os.environ.get('MUDO_BREAKER_FAILURE_RATIO', 0.5)),
+            slow_call_seconds=float(os.environ.get('MUDO_BREAKER_SLOW_CALL', 5)),
+            slow_call_ratio=float(os.environ.get('MUDO_BREAKER_SLOW_RATIO', 0.8)),
+            open_seconds=float(os.environ.get('MUDO_BREAKER_OPEN_SECONDS', 15)),
+        )
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning("Upstream devre durumu değişti", extra=fields(previous=self.state, state=state))
+            self.state = state
+            UPSTREAM_CIRCUIT_STATE.set(STATE_VALUES[state])
+
+    def allow(self):
+        """Çağrıya izin verir; devre açıksa CircuitOpenError yükseltir"""
+        self._admit(claim=True)
+
+    def check(self):
+        """allow() gibi reddeder ama yarı açık devrenin deneme hakkını almaz
+
+        Çağrıdan önce beklenecekse (ör. jeton sırası) erken ret için; asıl
+        çağrı yine allow()'dan geçer.
+        """
+        self._admit(claim=False)
+
+    def _admit(self, claim):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._set_state(HALF_OPEN)
+                self._probe_started = None
+            # Sonucu hiç kaydedilmeyen (ör. iptal edilen) deneme devreyi kilitlemesin
+            if self.state == HALF_OPEN and (self._probe_started is None
+                                            or now - self._probe_started >= self.open_seconds):
+                if claim:
+                    self._probe_started = now
+                return
+            raise CircuitOpenError('Mudo servisi şu anda yanıt vermiyor, lütfen biraz sonra tekrar deneyin')
+
+    def record(self, ok, seconds):
+        """İzin verilen her çağrının sonucunu kaydeder"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_started = None
+                if ok:
+                    self._calls.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._open(now)
+                return
+
+            self._calls.append((now, ok, seconds >= self.slow_call_seconds))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if self.state != CLOSED or total < self.min_calls:
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if failures / total >= self.failure_ratio or slow / total >= self.slow_call_ratio:
+                self._open(now)
+
+    def _open(self, now):
+        self._opened_at = now
+        self._calls.clear()
+        self._set_state(OPEN)
+
+
+class AdaptiveTimeout:
+    """Son ölçümlerin p95'ine göre read timeout"""
+
+    def __init__(self, max_timeout=15, min_timeout=3, multiplier=3, min_samples=20, size=200):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def timeout(self):
+        """Güncel read timeout; yeterli ölçüm yoksa max_timeout"""
+        p95 = self.p95()
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.multiplier))
@@ -0,0 +1,38 @@
+"""Stok cache'i, singleflight, hız sınırı ve stok geçmişinin ortak SQLite bağlantısı.
+
+Bir sqlite3 bağlantısı thread'ler ve süreçler arasında paylaşılamaz; her
+thread kendi bağlantısını açar. gunicorn uygulamayı master'da yükleyip
+fork ederse (--preload) üst süreçte açılmış bağlantı worker'a geçer; bu
+durum süreç kimliğinden anlaşılır ve worker yeni bağlantı açar (bkz.
+UpstreamClient.session). Devralınan bağlantı kapatılmaz, kapatmak üst
+sürecin WAL dosyasına dokunabilir.
+"""
+import os
+import sqlite3
+import threading
+
+# Fork öncesinden kalan bağlantılar; GC kapatmasın diye referansları tutulur
+_inherited = []
+
+
+class LocalConnection:
+    """Thread ve süreç başına açılan WAL modlu SQLite bağlantısı; çağrılınca döner"""
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        pid = os.getpid()
+        if conn is not None and self._local.pid != pid:
+            _inherited.append(conn)
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
@@ -0,0 +1,27 @@
+"""gunicorn ayarları.
+
+gunicorn çalışma dizinindeki bu dosyayı otomatik yükler; Dockerfile'daki
+komut satırı argümanları (bind, workers, timeout) geçerliliğini korur.
+PROMETHEUS_MULTIPROC_DIR tanımlıysa worker'ların metrik dosyaları burada
+yönetilir.
+"""
+import os
+import shutil
+
+# child_exit master'ın SIGCHLD işleyicisinden çalışır; aynı anda ölen
+# worker'larda import iç içe çalışıp yarım modül görmesin diye burada
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Önceki çalıştırmadan kalan metrik dosyalarını temizle
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Ölen worker'ın gauge değerlerini toplamdan çıkar
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,71 @@
+"""Yapılandırılmış, seviye kontrollü loglama.
+
+Tüm modüller print() yerine buradaki logger'ı kullanır. Seviye
+MUDO_LOG_LEVEL (DEBUG/INFO/WARNING/ERROR, varsayılan INFO) ile, biçim
+MUDO_LOG_FORMAT (json/text, varsayılan json) ile seçilir. Production'da
+MUDO_LOG_LEVEL=WARNING ile sıcak yoldaki loglar tamamen kapanır.
+
+Değişken veriler mesaja gömülmez, fields() ile alan olarak eklenir:
+    logger.info("Sorgu başarılı", extra=fields(barcode=barcode, stores=3))
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+LOGGER_NAME = 'mudo'
+
+
+class JsonFormatter(logging.Formatter):
+    """Her kaydı tek satır JSON olarak yazar"""
+
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        payload.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Geliştirme için okunabilir key=value biçimi"""
+
+    def format(self, record):
+        timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        extras = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        line = f"{timestamp} {record.levelname:<7} {record.getMessage()}"
+        if extras:
+            line = f"{line} {extras}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+def fields(**values):
+    """logger çağrılarına yapılandırılmış alan eklemek için extra sözlüğü"""
+    return {'fields': values}
+
+
+def setup_logger():
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return logger
+
+    handler = logging.StreamHandler(sys.stdout)
+    if os.environ.get('MUDO_LOG_FORMAT', 'json').lower() == 'text':
+        handler.setFormatter(TextFormatter())
+    else:
+        handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get('MUDO_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+    return logger
+
+
+logger = setup_logger()
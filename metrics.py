@@ -0,0 +1,102 @@
+"""Faz bazında gecikme ölçümü ve Prometheus metrikleri.
+
+Ölçülen fazlar (mudo_phase_seconds{phase=...}):
+- upstream_connect: yeni TCP bağlantısı kurma (havuzdan gelen bağlantıda yok)
+- upstream_ttfb: istek gönderiminden cevap başlıklarına kadar
+- upstream_download: cevap gövdesinin okunması
+- parse: HTML'in lxml ile indekslenmesi
+- extract: ürün/varyant/stok bilgilerinin çıkarılması
+- filter: mağaza eşleştirme, tekrar temizleme ve sıralama
+- serialize: /search JSON cevabının üretilmesi
+- compress: JSON cevabının gzip/br ile sıkıştırılması
+
+gunicorn altında her worker ayrı süreç olduğu için PROMETHEUS_MULTIPROC_DIR
+tanımlıysa prometheus_client'ın multiprocess modu kullanılır (bkz.
+gunicorn.conf.py); /metrics tüm worker'ların toplamını döndürür.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+PHASE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+PHASE_SECONDS = Histogram(
+    'mudo_phase_seconds', 'Sorgu fazlarının süresi (saniye)', ['phase'],
+    buckets=PHASE_BUCKETS
+)
+SEARCH_SECONDS = Histogram(
+    'mudo_search_seconds', 'Uçtan uca /search süresi (saniye)', ['cache'],
+    buckets=PHASE_BUCKETS
+)
+UPSTREAM_REQUESTS = Counter(
+    'mudo_upstream_requests_total', 'Upstream istekleri sonuca göre', ['outcome']
+)
+UPSTREAM_RETRIES = Counter(
+    'mudo_upstream_retries_total', 'Bağlantı hatası sonrası tekrar denemeler'
+)
+CACHE_LOOKUPS = Counter(
+    'mudo_cache_lookups_total', 'Stok cache sorguları sonuca göre (fresh/stale/negative/miss/coalesced)', ['result']
+)
+PARSE_MEMO = Counter(
+    'mudo_parse_memo_total', 'Sayfa özeti memoizasyonu sonuca göre (hit/miss/not_modified)', ['result']
+)
+STREAMED_PAGES = Counter(
+    'mudo_streamed_pages_total', 'Akışlı parse edilen sayfalar (early_exit: gövdenin sonu indirilmedi, full, memo_hit: önek aynı, indekslenmedi)', ['result']
+)
+BARCODE_REJECTED = Counter(
+    'mudo_barcode_rejected_total', 'Yerel doğrulamada reddedilen barkodlar nedene göre (format/checksum)', ['reason']
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'mudo_upstream_in_flight', 'Şu anda devam eden upstream istekleri',
+    multiprocess_mode='livesum'
+)
+SEARCH_IN_FLIGHT = Gauge(
+    'mudo_search_in_flight', 'Şu anda işlenen /search istekleri',
+    multiprocess_mode='livesum'
+)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    'mudo_upstream_queue_depth', 'Hız sınırlayıcıda jeton bekleyen upstream çağrıları', ['priority'],
+    multiprocess_mode='livesum'
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    'mudo_upstream_queue_wait_seconds', 'Upstream çağrısının jeton için beklediği süre (saniye)', ['priority'],
+    buckets=PHASE_BUCKETS
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    'mudo_upstream_circuit_state', 'Upstream devre kesici durumu (0 kapalı, 1 yarı açık, 2 açık)',
+    multiprocess_mode='livemax'
+)
+
+
+@contextmanager
+def timed(phase):
+    """Bloğun süresini ilgili faz histogramına yazar"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.labels(phase).observe(time.perf_counter() - start)
+
+
+def observe_phase(phase, seconds):
+    PHASE_SECONDS.labels(phase).observe(seconds)
+
+
+def render_metrics():
+    """/metrics cevabı: (gövde, content-type)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,107 @@
+"""Upstream sayfa gövdesinin özetine göre parse sonucu memoizasyonu.
+
+Stok, sorgulandığı sıklıktan çok daha seyrek değişir; aynı barkod için
+upstream çoğunlukla bayt bayt aynı sayfayı döndürür. Gövdenin blake2b özeti
+anahtar olarak kullanılır ve aynı özete sahip sayfa için lxml indeksleme ve
+çıkarma adımları tamamen atlanır.
+
+Upstream ETag/Last-Modified gönderiyorsa URL başına son doğrulayıcılar da
+tutulur; sonraki istek koşullu (If-None-Match/If-Modified-Since) gönderilir
+ve 304 cevabında son özete ait sonuç kullanılır.
+
+Akışlı parse'ta URL başına okunan gövde uzunluğu ve özeti de tutulur;
+sonraki cevap önce bu uzunluğa kadar tamponlanıp karşılaştırılır, sayfa
+aynıysa hiç indekslenmez.
+
+Tablolar süreç başınadır ve max_entries ile sınırlıdır (LRU).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class ParseMemo:
+    """Sayfa özeti -> parse sonucu ve URL -> doğrulayıcı LRU tabloları"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._validators = OrderedDict()
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(max_entries=int(os.environ.get('MUDO_PARSE_MEMO_SIZE', 256)))
+
+    @staticmethod
+    def hasher():
+        """Parça parça indirilen gövde için artımlı özet nesnesi"""
+        return hashlib.blake2b(digest_size=16)
+
+    @classmethod
+    def digest(cls, body):
+        hasher = cls.hasher()
+        hasher.update(body)
+        return hasher.hexdigest()
+
+    def _touch(self, table, key, value=None):
+        """LRU tablosunda okuma (value None) veya yazma"""
+        with self._lock:
+            if value is None:
+                value = table.get(key)
+                if value is not None:
+                    table.move_to_end(key)
+                return value
+            table[key] = value
+            table.move_to_end(key)
+            while len(table) > self.max_entries:
+                table.popitem(last=False)
+            return value
+
+    def get(self, digest):
+        """Özete ait parse sonucu; yoksa None"""
+        if self.max_entries <= 0:
+            return None
+        return self._touch(self._results, digest)
+
+    def put(self, digest, result):
+        if self.max_entries > 0:
+            self._touch(self._results, digest, result)
+
+    def remember(self, url, etag, last_modified, digest):
+        """Cevabın doğrulayıcılarını bir sonraki koşullu istek için saklar"""
+        if self.max_entries > 0 and (etag or last_modified):
+            self._touch(self._validators, url, (etag, last_modified, digest))
+
+    def conditional_headers(self, url):
+        """URL için koşullu istek başlıkları (sonucu hâlâ bellekte ise)"""
+        validators = self._touch(self._validators, url) if self.max_entries > 0 else None
+        if validators is None or self.get(validators[2]) is None:
+            return {}
+        etag, last_modified, _ = validators
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def remember_prefix(self, url, length, complete, digest):
+        """Akışlı parse'ın okuduğu gövde uzunluğunu (complete: erken durdu) ve özetini saklar"""
+        if self.max_entries > 0:
+            self._touch(self._prefixes, url, (length, complete, digest))
+
+    def stream_prefix(self, url):
+        """URL'nin son akışlı cevabı için (uzunluk, erken durdu mu, özet); sonucu bellekte değilse None"""
+        prefix = self._touch(self._prefixes, url) if self.max_entries > 0 else None
+        if prefix is None or self.get(prefix[2]) is None:
+            return None
+        return prefix
+
+    def not_modified(self, url):
+        """304 cevabında URL'nin son sayfasına ait sonuç; bellekte yoksa None"""
+        validators = self._touch(self._validators, url)
+        return self.get(validators[2]) if validators is not None else None
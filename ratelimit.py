@@ -0,0 +1,211 @@
+"""Upstream için worker'lar arası paylaşılan hız sınırı ve öncelikli sıra.
+
+TokenBucket jeton kovasını SQLite'ta (stok cache'i ile aynı dosya) tutar;
+tüm gunicorn worker'ları saniyede toplam `rate` istek, en fazla `burst`
+anlık patlama ile sınırlanır.
+
+Çağrılar üç öncelikten biriyle gelir:
+- INTERACTIVE: /search ve /search/stream (tezgâhtaki personel)
+- BATCH: /search/batch
+- BACKGROUND: bayat kayıt yenileme, sıcak barkod yenileme, varyant ön-yükleme
+
+Süreç içinde RateLimiter bekleyenleri öncelik (eşitse geliş) sırasıyla
+dizer; kovadan sadece sıranın başındaki çağrı jeton ister, böylece yeni
+gelen interaktif çağrı bekleyen toplu/arka plan çağrılarının önüne geçer.
+Worker'lar arasında ise düşük öncelikli çağrılar kovada `reserve` (arka
+plan için 2 × reserve) jeton kalacaksa jeton alabilir; kova boşalırken bu
+pay sadece interaktif çağrılara kalır. Kova doluyken toplam hız düşmez.
+
+Jeton max_wait içinde alınamazsa RateLimitError yükseltilir.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from db import LocalConnection
+from metrics import UPSTREAM_QUEUE_DEPTH, UPSTREAM_QUEUE_WAIT
+
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = ('interactive', 'batch', 'background')
+
+
+class RateLimitError(Exception):
+    """Jeton bekleme süresi aşıldığında upstream çağrısı yapılmadan yükseltilir"""
+
+
+class TokenBucket:
+    """SQLite üzerinde worker'lar arası paylaşılan jeton kovası"""
+
+    def __init__(self, path, rate=5.0, burst=10, reserve=3, name='upstream'):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        # Önceliğe göre kovada bırakılması gereken jeton sayısı
+        self.floors = tuple(min(reserve * priority, burst - 1) for priority in range(len(PRIORITY_NAMES)))
+        self._connect = LocalConnection(path)
+        conn = self._connect()
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS rate_bucket (
+                   name TEXT PRIMARY KEY,
+                   tokens REAL NOT NULL,
+                   updated_at REAL NOT NULL
+               )'''
+        )
+        conn.execute(
+            'INSERT OR IGNORE INTO rate_bucket (name, tokens, updated_at) VALUES (?, ?, ?)',
+            (name, burst, time.time())
+        )
+
+    def take(self, priority=INTERACTIVE):
+        """Jeton alırsa 0, alamazsa jeton birikene kadar beklenecek süre (saniye)"""
+        needed = 1 + self.floors[priority]
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            tokens, updated_at = conn.execute(
+                'SELECT tokens, updated_at FROM rate_bucket WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+            wait = 0.0 if tokens >= needed else (needed - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                'UPDATE rate_bucket SET tokens = ?, updated_at = ? WHERE name = ?',
+                (tokens, now, self.name)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def refund(self):
+        """Alınıp kullanılmayan jetonu kovaya geri koyar (burst'ü aşmadan)"""
+        self._connect().execute(
+            'UPDATE rate_bucket SET tokens = MIN(?, tokens + 1) WHERE name = ?', (self.burst, self.name)
+        )
+
+
+class RateLimiter:
+    """Süreç içi öncelikli bekleme sırası + paylaşılan jeton kovası"""
+
+    def __init__(self, bucket=None, max_wait=10, background_max_wait=20, poll_interval=0.05):
+        self.bucket = bucket
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.poll_interval = poll_interval
+        self._queue = []  # (öncelik, sıra) heap'i
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, path):
+        """Ayarları ortam değişkenlerinden okur; MUDO_RATE_LIMIT_RATE=0 sınırı kapatır"""
+        rate = float(os.environ.get('MUDO_RATE_LIMIT_RATE', 5))
+        bucket = TokenBucket(
+            path, rate=rate,
+            burst=max(1, int(os.environ.get('MUDO_RATE_LIMIT_BURST', 10))),
+            reserve=int(os.environ.get('MUDO_RATE_LIMIT_RESERVE', 3)),
+        ) if rate > 0 else None
+        return cls(
+            bucket,
+            max_wait=float(os.environ.get('MUDO_RATE_LIMIT_MAX_WAIT', 10)),
+            background_max_wait=float(os.environ.get('MUDO_RATE_LIMIT_BACKGROUND_MAX_WAIT', 20)),
+        )
+
+    def refund(self):
+        """acquire() ile alınıp upstream'e gitmeden kalan jetonu iade eder"""
+        if self.bucket is not None:
+            self.bucket.refund()
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._cond.notify_all()  # bekleyen baş çağrı sırayı yeniden kontrol etsin
+        UPSTREAM_QUEUE_DEPTH.labels(PRIORITY_NAMES[priority]).inc()
+        return ticket
+
+    def _dequeue(self, ticket, started):
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+        name = PRIORITY_NAMES[ticket[0]]
+        UPSTREAM_QUEUE_DEPTH.labels(name).dec()
+        UPSTREAM_QUEUE_WAIT.labels(name).observe(time.monotonic() - started)
+
+    def _deadline(self, priority):
+        max_wait = self.max_wait if priority == INTERACTIVE else self.background_max_wait
+        return time.monotonic() + max_wait
+
+    def _at_head(self, ticket):
+        with self._cond:
+            return self._queue[0] == ticket
+
+    def _try_take(self, ticket):
+        """Sıranın başındaysa kovadan jeton ister; 0 ise jeton alındı"""
+        if not self._at_head(ticket):
+            return self.poll_interval
+        return self.bucket.take(ticket[0])
+
+    @staticmethod
+    def _rejected(priority):
+        return RateLimitError(
+            'Mudo servisine çok fazla istek gönderiliyor, lütfen biraz sonra tekrar deneyin'
+            if priority == INTERACTIVE else 'Upstream istek sırası dolu'
+        )
+
+    def acquire(self, priority=INTERACTIVE):
+        """Jeton alınana kadar bekler; süre aşılırsa RateLimitError"""
+        if self.bucket is None:
+            return
+        started = time.monotonic()
+        deadline = self._deadline(priority)
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_take(ticket)
+                if not wait:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._rejected(priority)
+                with self._cond:
+                    # Sıra değişirse (yeni çağrı, biten çağrı) erken uyanır
+                    self._cond.wait(min(wait, remaining))
+        finally:
+            self._dequeue(ticket, started)
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """acquire() karşılığı; event loop'u bloklamadan kısa aralıklarla dener
+
+        Kovanın SQLite işlemi (BEGIN IMMEDIATE) thread'de yapılır.
+        """
+        if self.bucket is None:
+            return
+        started = time.monotonic()
+        deadline = self._deadline(priority)
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                if self._at_head(ticket):
+                    wait = await asyncio.to_thread(self.bucket.take, ticket[0])
+                else:
+                    wait = self.poll_interval
+                if not wait:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._rejected(priority)
+                await asyncio.sleep(min(wait, remaining, self.poll_interval))
+        finally:
+            self._dequeue(ticket, started)
@@ -0,0 +1,171 @@
+"""Aynı barkod için eşzamanlı sorguları tek bir upstream çağrısında birleştirir.
+
+Süreç içinde aynı anahtarı bekleyen thread'ler lider thread'in sonucunu
+bekler. Süreçler arası (gunicorn worker'ları) koordinasyon, stok cache'i ile
+aynı SQLite dosyasındaki kısa ömürlü bir "lease" tablosu üzerinden yapılır:
+lease'i alan worker sorguyu çalıştırır ve sonucu tabloya yazar, diğerleri
+sonucu oradan okur. Sonuç tabloda result_ttl boyunca kalır ama sadece
+lease bırakılmadan önce beklemeye başlayanlar içindir; sonradan gelen
+çağrı eski sonucu silip lease'i kendisi alır (gizli bir cache olmasın).
+
+do_async() aynı mekanizmayı ASGI modu için asyncio future'ları ile sağlar;
+lease tablosuna erişim event loop'u bloklamamak için thread'de yapılır.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from db import LocalConnection
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'shared')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = False
+
+
+class SingleFlight:
+    """Anahtar başına tek uçuş (singleflight) koordinatörü"""
+
+    def __init__(self, path, lease_ttl=30, result_ttl=2, poll_interval=0.05):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._connect = LocalConnection(path)
+        self._connect().execute(
+            '''CREATE TABLE IF NOT EXISTS inflight (
+                   key TEXT PRIMARY KEY,
+                   payload TEXT,
+                   expires_at REAL NOT NULL
+               )'''
+        )
+
+    def do(self, key, fn):
+        """fn()'i anahtar başına bir kez çalıştırır; (sonuç, paylaşıldı mı) döndürür"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, call.shared = self._do_shared(key, fn)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.shared
+
+    def _do_shared(self, key, fn):
+        started = time.time()
+        deadline = started + self.lease_ttl
+        while True:
+            if self._acquire(key, started):
+                try:
+                    result = fn()
+                except Exception:
+                    self._release(key, None)
+                    raise
+                self._release(key, result)
+                return result, False
+
+            payload = self._peek(key)
+            if payload is not None:
+                return json.loads(payload), True
+            if time.time() > deadline:
+                # Lider worker cevap vermedi, kendimiz çalıştıralım
+                return fn(), False
+            time.sleep(self.poll_interval)
+
+    async def do_async(self, key, fn):
+        """do() karşılığı; fn bir coroutine fonksiyonudur"""
+        call = self._async_calls.get(key)
+        if call is not None:
+            return await asyncio.shield(call), True
+
+        call = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = call
+        try:
+            result, shared = await self._do_shared_async(key, fn)
+            call.set_result(result)
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except Exception as e:
+            call.set_exception(e)
+            call.exception()  # bekleyen yoksa "never retrieved" uyarısını engelle
+            raise
+        finally:
+            del self._async_calls[key]
+        return result, shared
+
+    async def _do_shared_async(self, key, fn):
+        started = time.time()
+        deadline = started + self.lease_ttl
+        while True:
+            if await asyncio.to_thread(self._acquire, key, started):
+                try:
+                    result = await fn()
+                except BaseException:
+                    await asyncio.to_thread(self._release, key, None)
+                    raise
+                await asyncio.to_thread(self._release, key, result)
+                return result, False
+
+            payload = await asyncio.to_thread(self._peek, key)
+            if payload is not None:
+                return json.loads(payload), True
+            if time.time() > deadline:
+                return await fn(), False
+            await asyncio.sleep(self.poll_interval)
+
+    def _acquire(self, key, started):
+        """Lease'i alırsa True; started'dan önce bırakılmış sonuç silinir"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('DELETE FROM inflight WHERE expires_at < ?', (now,))
+        # Bırakılma anı = expires_at - result_ttl; çağrıdan önce bittiyse paylaşılmaz
+        conn.execute(
+            'DELETE FROM inflight WHERE key = ? AND payload IS NOT NULL AND expires_at <= ?',
+            (key, started + self.result_ttl)
+        )
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO inflight (key, payload, expires_at) VALUES (?, NULL, ?)',
+            (key, now + self.lease_ttl)
+        )
+        return cursor.rowcount == 1
+
+    def _peek(self, key):
+        row = self._connect().execute(
+            'SELECT payload FROM inflight WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _release(self, key, result):
+        conn = self._connect()
+        if result is None:
+            conn.execute('DELETE FROM inflight WHERE key = ?', (key,))
+            return
+        conn.execute(
+            'UPDATE inflight SET payload = ?, expires_at = ? WHERE key = ?',
+            (json.dumps(result, ensure_ascii=False), time.time() + self.result_ttl, key)
+        )
@@ -0,0 +1,414 @@
+"""Barkod ve mağaza bazında kalıcı stok geçmişi, sıcak barkodların yenilenmesi.
+
+Her başarılı upstream sonucu yerel bir SQLite dosyasına yazılır:
+
+- stock_latest: (barkod, mağaza) başına son bilinen stok, son kontrol ve son
+  değişim zamanı
+- stock_history: stok değeri değiştiğinde eklenen satırlar; listeden düşen
+  mağaza '0' olarak kaydedilir. "Bu mağazada stok ne zaman bitti" sorusu
+  upstream'e gitmeden cevaplanır.
+- barcode_activity: kullanıcı sorgu sayısı ve bir sonraki yenileme zamanı
+- store_stock: ters indeks, mağaza -> barkod -> adet (sadece stoğu olanlar).
+  "Bu barkodlardan hangileri şu mağazada var" sorusu barkod başına upstream
+  sorgusu yapılmadan tek bir SQLite sorgusuyla cevaplanır.
+
+HotRefresher son hot_window içinde en çok sorgulanan barkodları arka planda
+yeniden sorgular. Aralık stok değişmedikçe min_interval'dan max_interval'a
+kadar ikiye katlanır, değişim görüldüğünde başa döner. Her worker kendi
+thread'ini çalıştırır; barkodlar SQLite üzerinden tek bir worker'a verilir.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from db import LocalConnection
+from log import fields, logger
+from stock_parser import DIGITS_RE
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'mudo_stock_snapshots.sqlite3')
+
+# Listeden düşen mağazanın kaydedilen stok değeri
+OUT_OF_STOCK = '0'
+
+
+def isoformat(timestamp):
+    """Epoch saniyesini ISO 8601 (UTC) metnine çevirir"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='seconds')
+
+
+def parse_timestamp(value):
+    """ISO 8601 tarih/saat metnini epoch saniyesine çevirir (saat dilimi yoksa UTC)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def stock_units(stock):
+    """Stok metnindeki adet ('5', '5 adet' -> 5); sayı yoksa 0"""
+    match = DIGITS_RE.search(stock or '')
+    return int(match.group()) if match else 0
+
+
+class SnapshotStore:
+    """SQLite üzerinde barkod/mağaza stok geçmişi"""
+
+    def __init__(self, path=DEFAULT_PATH, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self._connect = LocalConnection(path)
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(
+            path=os.environ.get('MUDO_SNAPSHOT_PATH', DEFAULT_PATH),
+            retention_days=float(os.environ.get('MUDO_SNAPSHOT_RETENTION_DAYS', 30)),
+        )
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS stock_latest (
+                   barcode TEXT NOT NULL,
+                   store_id TEXT NOT NULL,
+                   store TEXT NOT NULL,
+                   stock TEXT NOT NULL,
+                   checked_at REAL NOT NULL,
+                   changed_at REAL NOT NULL,
+                   PRIMARY KEY (barcode, store_id)
+               )'''
+        )
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS stock_history (
+                   barcode TEXT NOT NULL,
+                   store_id TEXT NOT NULL,
+                   store TEXT NOT NULL,
+                   stock TEXT NOT NULL,
+                   recorded_at REAL NOT NULL
+               )'''
+        )
+        conn.execute(
+            '''CREATE INDEX IF NOT EXISTS stock_history_lookup
+               ON stock_history (barcode, store_id, recorded_at)'''
+        )
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS barcode_activity (
+                   barcode TEXT PRIMARY KEY,
+                   title TEXT,
+                   hits INTEGER NOT NULL DEFAULT 0,
+                   last_hit_at REAL NOT NULL DEFAULT 0,
+                   checked_at REAL NOT NULL DEFAULT 0,
+                   unchanged_polls INTEGER NOT NULL DEFAULT 0,
+                   next_poll_at REAL NOT NULL DEFAULT 0
+               )'''
+        )
+        conn.execute(
+            '''CREATE TABLE IF NOT EXISTS store_stock (
+                   store_id TEXT NOT NULL,
+                   barcode TEXT NOT NULL,
+                   units INTEGER NOT NULL,
+                   PRIMARY KEY (store_id, barcode)
+               ) WITHOUT ROWID'''
+        )
+        self._backfill_store_stock(conn)
+
+    def _backfill_store_stock(self, conn):
+        """Ters indeksi olmayan eski dosyalarda stock_latest'ten bir kez doldurur"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM store_stock LIMIT 1').fetchone() is None:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO store_stock (store_id, barcode, units) VALUES (?, ?, ?)',
+                    [
+                        (store_id, barcode, units)
+                        for store_id, barcode, stock in conn.execute(
+                            'SELECT store_id, barcode, stock FROM stock_latest')
+                        for units in (stock_units(stock),) if units > 0
+                    ]
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def record(self, barcode, result):
+        """Başarılı sonucun mağaza stoklarını kaydeder; değişen mağaza sayısını döndürür
+
+        partial sonuçta (akışlı parse sayfanın sonunu okumadı) listede olmayan
+        mağazalar stoğu bitmiş sayılmaz, son değerleri korunur.
+        """
+        now = time.time()
+        current = {item['store_id']: item for item in result.get('stock_data', [])}
+        title = result.get('product_info', {}).get('title')
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            latest = {
+                store_id: (store, stock) for store_id, store, stock in conn.execute(
+                    'SELECT store_id, store, stock FROM stock_latest WHERE barcode = ?', (barcode,)
+                )
+            }
+
+            rows = [(store_id, item['store'], item['stock']) for store_id, item in current.items()]
+            if not result.get('partial'):
+                rows += [
+                    (store_id, store, OUT_OF_STOCK)
+                    for store_id, (store, stock) in latest.items() if store_id not in current
+                ]
+            changes = [row for row in rows if latest.get(row[0], (None, None))[1] != row[2]]
+
+            conn.executemany(
+                '''INSERT INTO stock_history (barcode, store_id, store, stock, recorded_at)
+                   VALUES (?, ?, ?, ?, ?)''',
+                [(barcode, store_id, store, stock, now) for store_id, store, stock in changes]
+            )
+            conn.executemany(
+                '''INSERT INTO stock_latest (barcode, store_id, store, stock, checked_at, changed_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(barcode, store_id) DO UPDATE SET
+                       store = excluded.store,
+                       stock = excluded.stock,
+                       checked_at = excluded.checked_at,
+                       changed_at = CASE WHEN stock_latest.stock = excluded.stock
+                                         THEN stock_latest.changed_at ELSE excluded.changed_at END''',
+                [(barcode, store_id, store, stock, now, now) for store_id, store, stock in rows]
+            )
+            # Ters indeks: stoğu biten mağaza indeksten çıkar
+            units = [(store_id, stock_units(stock)) for store_id, _, stock in changes]
+            conn.executemany(
+                '''INSERT INTO store_stock (store_id, barcode, units) VALUES (?, ?, ?)
+                   ON CONFLICT(store_id, barcode) DO UPDATE SET units = excluded.units''',
+                [(store_id, barcode, count) for store_id, count in units if count > 0]
+            )
+            conn.executemany(
+                'DELETE FROM store_stock WHERE store_id = ? AND barcode = ?',
+                [(store_id, barcode) for store_id, count in units if count <= 0]
+            )
+            conn.execute(
+                '''INSERT INTO barcode_activity (barcode, title, checked_at)
+                   VALUES (?, ?, ?)
+                   ON CONFLICT(barcode) DO UPDATE SET
+                       title = COALESCE(excluded.title, barcode_activity.title),
+                       checked_at = excluded.checked_at,
+                       unchanged_polls = CASE WHEN ? THEN 0 ELSE barcode_activity.unchanged_polls + 1 END''',
+                (barcode, title, now, bool(changes))
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return len(changes)
+
+    def touch(self, barcode, hot_window):
+        """Kullanıcı sorgusunu sayar; hot_window'dan uzun ara verilmişse sayaç sıfırlanır"""
+        now = time.time()
+        self._connect().execute(
+            '''INSERT INTO barcode_activity (barcode, hits, last_hit_at)
+               VALUES (?, 1, ?)
+               ON CONFLICT(barcode) DO UPDATE SET
+                   hits = CASE WHEN barcode_activity.last_hit_at < ? THEN 1
+                               ELSE barcode_activity.hits + 1 END,
+                   last_hit_at = excluded.last_hit_at''',
+            (barcode, now, now - hot_window)
+        )
+
+    def due_barcodes(self, hot_window, min_hits, limit):
+        """Yenileme zamanı gelmiş sıcak barkodlar: [(barkod, değişmeyen yenileme sayısı)]"""
+        now = time.time()
+        return self._connect().execute(
+            '''SELECT barcode, unchanged_polls FROM barcode_activity
+               WHERE last_hit_at >= ? AND hits >= ? AND next_poll_at <= ?
+               ORDER BY hits DESC LIMIT ?''',
+            (now - hot_window, min_hits, now, limit)
+        ).fetchall()
+
+    def claim_poll(self, barcode, interval):
+        """Barkodun bu turdaki yenilemesini tek bir worker'a verir"""
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE barcode_activity SET next_poll_at = ? WHERE barcode = ? AND next_poll_at <= ?',
+            (now + interval, barcode, now)
+        )
+        return cursor.rowcount == 1
+
+    def latest(self, barcode):
+        """Barkodun son bilinen mağaza stokları; hiç kaydı yoksa None"""
+        conn = self._connect()
+        activity = conn.execute(
+            'SELECT title, checked_at FROM barcode_activity WHERE barcode = ? AND checked_at > 0',
+            (barcode,)
+        ).fetchone()
+        if activity is None:
+            return None
+
+        title, checked_at = activity
+        rows = conn.execute(
+            '''SELECT store_id, store, stock, checked_at, changed_at FROM stock_latest
+               WHERE barcode = ? ORDER BY store''',
+            (barcode,)
+        ).fetchall()
+        return {
+            'barcode': barcode,
+            'title': title,
+            'checked_at': isoformat(checked_at),
+            'stock_data': [
+                {
+                    'store_id': store_id,
+                    'store': store,
+                    'stock': stock,
+                    'checked_at': isoformat(store_checked_at),
+                    'changed_at': isoformat(changed_at),
+                }
+                for store_id, store, stock, store_checked_at, changed_at in rows
+            ],
+        }
+
+    def history(self, barcode, store_id=None, since=None, limit=500):
+        """Stok değişimleri (eskiden yeniye); her satırda bir önceki değer de bulunur"""
+        rows = self._connect().execute(
+            '''SELECT store_id, store, stock, previous, recorded_at FROM (
+                   SELECT store_id, store, stock, recorded_at,
+                          LAG(stock) OVER (PARTITION BY store_id ORDER BY recorded_at) AS previous
+                   FROM stock_history
+                   WHERE barcode = ? AND (? IS NULL OR store_id = ?)
+               )
+               WHERE recorded_at >= ?
+               ORDER BY recorded_at, store_id LIMIT ?''',
+            (barcode, store_id, store_id, since or 0, limit)
+        ).fetchall()
+        return [
+            {
+                'store_id': row_store_id,
+                'store': store,
+                'stock': stock,
+                'previous': previous,
+                'recorded_at': isoformat(recorded_at),
+            }
+            for row_store_id, store, stock, previous, recorded_at in rows
+        ]
+
+    def store_inventory(self, store_ids, barcodes=None, min_units=1, limit=1000):
+        """Verilen mağazalarda en az min_units stoğu olan barkodlar
+
+        barcodes None ise mağazalardaki tüm barkodlar döner. Her satır:
+        (mağaza kodu, mağaza, barkod, ürün adı, stok, adet, son kontrol).
+        """
+        rows = self._connect().execute(
+            '''SELECT s.store_id, l.store, s.barcode, a.title, l.stock, s.units, l.checked_at
+               FROM store_stock AS s
+               JOIN stock_latest AS l ON l.barcode = s.barcode AND l.store_id = s.store_id
+               LEFT JOIN barcode_activity AS a ON a.barcode = s.barcode
+               WHERE s.store_id IN (SELECT value FROM json_each(?))
+                 AND (? IS NULL OR s.barcode IN (SELECT value FROM json_each(?)))
+                 AND s.units >= ?
+               ORDER BY s.units DESC LIMIT ?''',
+            (json.dumps(store_ids), None if barcodes is None else 1,
+             json.dumps(barcodes or []), min_units, limit)
+        ).fetchall()
+        return [
+            (store_id, store, barcode, title, stock, units, isoformat(checked_at))
+            for store_id, store, barcode, title, stock, units, checked_at in rows
+        ]
+
+    def known_barcodes(self, barcodes):
+        """Listeden en az bir kez upstream'den kaydedilmiş barkodlar"""
+        return {
+            barcode for (barcode,) in self._connect().execute(
+                '''SELECT barcode FROM barcode_activity
+                   WHERE checked_at > 0 AND barcode IN (SELECT value FROM json_each(?))''',
+                (json.dumps(barcodes),)
+            )
+        }
+
+    def prune(self):
+        """Saklama süresini aşan geçmiş satırlarını siler"""
+        cutoff = time.time() - self.retention_days * 86400
+        cursor = self._connect().execute('DELETE FROM stock_history WHERE recorded_at < ?', (cutoff,))
+        return cursor.rowcount
+
+
+class HotRefresher:
+    """Sıcak barkodları uyarlamalı aralıkla arka planda yeniden sorgular"""
+
+    def __init__(self, snapshots, refresh, max_barcodes=50, hot_window=3600, min_hits=3,
+                 min_interval=45, max_interval=900, tick=5, prune_interval=3600):
+        self.snapshots = snapshots
+        self.refresh = refresh
+        self.max_barcodes = max_barcodes
+        self.hot_window = hot_window
+        self.min_hits = min_hits
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tick = tick
+        self.prune_interval = prune_interval
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, snapshots, refresh):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(
+            snapshots, refresh,
+            max_barcodes=int(os.environ.get('MUDO_REFRESH_MAX_BARCODES', 50)),
+            hot_window=float(os.environ.get('MUDO_REFRESH_HOT_WINDOW', 3600)),
+            min_hits=int(os.environ.get('MUDO_REFRESH_MIN_HITS', 3)),
+            min_interval=float(os.environ.get('MUDO_REFRESH_MIN_INTERVAL', 45)),
+            max_interval=float(os.environ.get('MUDO_REFRESH_MAX_INTERVAL', 900)),
+        )
+
+    def interval(self, unchanged_polls):
+        """Stok değişmedikçe ikiye katlanan yenileme aralığı"""
+        return min(self.max_interval, self.min_interval * 2 ** min(unchanged_polls, 16))
+
+    def track(self, barcode):
+        """Kullanıcı sorgusunu kaydeder ve bu süreçte yenileyiciyi başlatır"""
+        if self.max_barcodes <= 0:
+            return
+        self.snapshots.touch(barcode, self.hot_window)
+        self.start()
+
+    def start(self):
+        """Worker sürecine ait yenileme thread'ini başlatır (fork sonrası yeniden)"""
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+        with self._lock:
+            if self._thread_pid != pid:
+                threading.Thread(target=self._run, name='hot-refresher', daemon=True).start()
+                self._thread_pid = pid
+
+    def run_once(self):
+        """Zamanı gelen barkodları yeniler; yenilenen barkod sayısını döndürür"""
+        refreshed = 0
+        for barcode, unchanged_polls in self.snapshots.due_barcodes(
+                self.hot_window, self.min_hits, self.max_barcodes):
+            if not self.snapshots.claim_poll(barcode, self.interval(unchanged_polls)):
+                continue
+            try:
+                self.refresh(barcode)
+                refreshed += 1
+            except Exception as e:
+                logger.warning("Sıcak barkod yenileme hatası", extra=fields(barcode=barcode, error=str(e)))
+        return refreshed
+
+    def _run(self):
+        last_prune = 0
+        while True:
+            try:
+                refreshed = self.run_once()
+                if refreshed:
+                    logger.debug("Sıcak barkodlar yenilendi", extra=fields(count=refreshed))
+                if time.monotonic() - last_prune > self.prune_interval:
+                    self.snapshots.prune()
+                    last_prune = time.monotonic()
+            except Exception:
+                logger.exception("Yenileyici hatası")
+            time.sleep(self.tick)
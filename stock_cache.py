@@ -0,0 +1,180 @@
+"""Gunicorn worker'ları arasında paylaşılan, TTL tabanlı stok sonuç cache'i.
+
+Sonuçlar yerel bir SQLite dosyasında (WAL modunda) barkod anahtarıyla tutulur,
+böylece aynı makinedeki tüm worker süreçleri aynı cache'i görür.
+
+- ttl: bu süre içindeki kayıtlar taze kabul edilir
+- stale_ttl: ttl dolduktan sonra bu kadar süre daha kayıt bayat olarak
+  döndürülebilir (stale-while-revalidate), arka planda yenilenir
+- max_entries: sınır aşılınca en uzun süredir okunmayan kayıtlar silinir (LRU)
+
+Upstream devre kesicisi açıkken get_expired() süresi dolmuş kayıtları da
+döndürür (EXPIRED); eski veri hiç cevap vermemekten iyidir.
+
+Upstream'in "bulunamadı" sayfaları ayrı bir tabloda negative_ttl kadar
+tutulur (NEGATIVE); bayat sunulmaz, arka planda yenilenmez, süresi dolunca
+silinir. Aynı barkoda bir sonuç yazılması diğer tablodaki kaydı siler.
+"""
+import json
+import os
+import tempfile
+import time
+
+from db import LocalConnection
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'mudo_stock_cache.sqlite3')
+
+FRESH = 'fresh'
+STALE = 'stale'
+EXPIRED = 'expired'
+NEGATIVE = 'negative'
+
+
+class StockCache:
+    """SQLite üzerinde süreçler arası paylaşılan LRU + TTL cache"""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=60, stale_ttl=300, max_entries=5000,
+                 refresh_timeout=30, negative_ttl=300):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.refresh_timeout = refresh_timeout
+        self.negative_ttl = negative_ttl
+        self._connect = LocalConnection(path)
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls):
+        """Ayarları ortam değişkenlerinden okur"""
+        return cls(
+            path=os.environ.get('MUDO_CACHE_PATH', DEFAULT_PATH),
+            ttl=float(os.environ.get('MUDO_CACHE_TTL', 60)),
+            stale_ttl=float(os.environ.get('MUDO_CACHE_STALE_TTL', 300)),
+            max_entries=int(os.environ.get('MUDO_CACHE_MAX_ENTRIES', 5000)),
+            negative_ttl=float(os.environ.get('MUDO_NEGATIVE_CACHE_TTL', 300)),
+        )
+
+    def _init_schema(self):
+        self._connect().execute(
+            '''CREATE TABLE IF NOT EXISTS stock_cache (
+                   barcode TEXT PRIMARY KEY,
+                   payload TEXT NOT NULL,
+                   stored_at REAL NOT NULL,
+                   accessed_at REAL NOT NULL,
+                   refreshing_until REAL NOT NULL DEFAULT 0
+               )'''
+        )
+        self._connect().execute(
+            'CREATE INDEX IF NOT EXISTS stock_cache_accessed ON stock_cache (accessed_at)'
+        )
+        self._connect().execute(
+            '''CREATE TABLE IF NOT EXISTS negative_cache (
+                   barcode TEXT PRIMARY KEY,
+                   payload TEXT NOT NULL,
+                   stored_at REAL NOT NULL
+               )'''
+        )
+        self._connect().execute(
+            'CREATE INDEX IF NOT EXISTS negative_cache_stored ON negative_cache (stored_at)'
+        )
+
+    def get(self, barcode):
+        """(sonuç, durum) döndürür; durum FRESH, STALE veya NEGATIVE. Kayıt yoksa None."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT payload, stored_at FROM stock_cache WHERE barcode = ?', (barcode,)
+        ).fetchone()
+        if row is None:
+            return self._get_negative(conn, barcode, now)
+
+        payload, stored_at = row
+        age = now - stored_at
+        if age > self.ttl + self.stale_ttl:
+            # Silinmez; devre açıkken get_expired() ile döndürülebilir, LRU temizler
+            return None
+
+        conn.execute('UPDATE stock_cache SET accessed_at = ? WHERE barcode = ?', (now, barcode))
+        return json.loads(payload), (FRESH if age <= self.ttl else STALE)
+
+    def _get_negative(self, conn, barcode, now):
+        if self.negative_ttl <= 0:
+            return None
+        row = conn.execute(
+            'SELECT payload FROM negative_cache WHERE barcode = ? AND stored_at >= ?',
+            (barcode, now - self.negative_ttl)
+        ).fetchone()
+        return (json.loads(row[0]), NEGATIVE) if row else None
+
+    def is_negative(self, barcode):
+        """Barkod "bulunamadı" olarak negatif cache'te mi"""
+        return self._get_negative(self._connect(), barcode, time.time()) is not None
+
+    def get_expired(self, barcode):
+        """Yaşına bakmadan son kaydı döndürür; kayıt yoksa None"""
+        row = self._connect().execute(
+            'SELECT payload FROM stock_cache WHERE barcode = ?', (barcode,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, barcode, result):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            '''INSERT INTO stock_cache (barcode, payload, stored_at, accessed_at)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(barcode) DO UPDATE SET
+                   payload = excluded.payload,
+                   stored_at = excluded.stored_at,
+                   accessed_at = excluded.accessed_at,
+                   refreshing_until = 0''',
+            (barcode, json.dumps(result, ensure_ascii=False), now, now)
+        )
+        conn.execute('DELETE FROM negative_cache WHERE barcode = ?', (barcode,))
+        self._evict(conn)
+
+    def set_negative(self, barcode, result):
+        """Upstream'de bulunamayan barkodun sonucunu negative_ttl süresince tutar"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            '''INSERT INTO negative_cache (barcode, payload, stored_at) VALUES (?, ?, ?)
+               ON CONFLICT(barcode) DO UPDATE SET
+                   payload = excluded.payload,
+                   stored_at = excluded.stored_at''',
+            (barcode, json.dumps(result, ensure_ascii=False), now)
+        )
+        conn.execute('DELETE FROM stock_cache WHERE barcode = ?', (barcode,))
+        # Süresi dolanları ve sınırı aşan en eski kayıtları sil
+        conn.execute('DELETE FROM negative_cache WHERE stored_at < ?', (now - self.negative_ttl,))
+        conn.execute(
+            '''DELETE FROM negative_cache WHERE barcode IN (
+                   SELECT barcode FROM negative_cache
+                   ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+               )''',
+            (self.max_entries,)
+        )
+
+    def claim_refresh(self, barcode):
+        """Bayat kaydı yenileme hakkını tek bir worker'a verir"""
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE stock_cache SET refreshing_until = ? WHERE barcode = ? AND refreshing_until < ?',
+            (now + self.refresh_timeout, barcode, now)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, barcode):
+        conn = self._connect()
+        conn.execute('DELETE FROM stock_cache WHERE barcode = ?', (barcode,))
+        conn.execute('DELETE FROM negative_cache WHERE barcode = ?', (barcode,))
+
+    def _evict(self, conn):
+        conn.execute(
+            '''DELETE FROM stock_cache WHERE barcode IN (
+                   SELECT barcode FROM stock_cache
+                   ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+               )''',
+            (self.max_entries,)
+        )
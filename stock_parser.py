@@ -0,0 +1,582 @@
+"""Mudo StokSorgula sayfası için tek geçişli parse motoru.
+
+Sayfa lxml'in HTML parser'ına "target" olarak verilir; DOM kurulmadan tek bir
+olay akışında tüm etiketler belge sırasıyla indekslenir ve her etiketin metni
+ortak bir metin tamponundaki (başlangıç, bitiş) aralığı olarak tutulur.
+Böylece get_text() iç içe div'lerde tekrar tekrar ağacı dolaşmaz ve
+find_all() çağrıları bisect ile alt ağaç aralığına indirgenir.
+
+Metin kuralları BeautifulSoup(html, 'lxml') ile birebir aynıdır: script,
+style, template, rt ve rp içeriği ile yorumlar get_text()'e girmez, sadece
+boşluktan oluşan metin parçaları tek boşluğa veya satır sonuna indirgenir
+(pre/textarea hariç).
+
+StockPageStream aynı indeksi upstream gövdesi indirilirken parça parça
+besler; ürün başlığı, varyant tablosu ve mağaza tablosu yakalandığı anda
+"complete" olur ve çağıran indirmeyi ve parse'ı bırakabilir.
+"""
+import codecs
+import json
+import logging
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from operator import attrgetter
+
+from lxml import etree
+
+from barcodes import is_gtin
+from log import fields, logger
+
+# BeautifulSoup HTMLTreeBuilder ile aynı değerler
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+STRING_CONTAINER_TAGS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+
+PAGE_DEFAULT_TITLE = "MUDO - Stok Sorgula"
+
+NAME_PATTERNS = [
+    re.compile(r'"urunAdi"\s*:\s*"([^"]+)"'),
+    re.compile(r'"productName"\s*:\s*"([^"]+)"'),
+    re.compile(r'"name"\s*:\s*"([^"]+)"'),
+    re.compile(r'urunAdi\s*=\s*"([^"]+)"'),
+]
+
+CODE_LABEL_RE = re.compile(r'ürün\s*no|model\s*no|ürün\s*kodu')
+CODE_RE = re.compile(r'(\d{3}-\d-\d{3}-\d{2}-\d{3}|\d+)')
+PRICE_LABEL_RE = re.compile(r'₺|tl|lira|fiyat')
+PRICE_RE = re.compile(r'(\d+[.,]?\d*)\s*(?:₺|tl)')
+STATUS_LABEL_RE = re.compile(r'satış\s*durumu|durum')
+DISCOUNT_RE = re.compile(r'%\s*(\d+)')
+DIGITS_RE = re.compile(r'\d+')
+ANY_DIGIT_RE = re.compile(r'\d')
+ONLY_DIGITS_RE = re.compile(r'^\d+$')
+
+DIV_STOCK_PATTERNS = [
+    re.compile(r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+)', re.IGNORECASE),
+    re.compile(r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+\s*adet)', re.IGNORECASE),
+    re.compile(r'([A-Za-zÇĞıİÖŞÜçğıiöşü\s]+)[\s:]+(\d+\s*stok)', re.IGNORECASE),
+]
+SCRIPT_JSON_RE = re.compile(r'\{[^{}]*(?:"stok"|"stock"|"magaza")[^{}]*\}')
+
+VARIANT_HEADER_KEYWORDS = ['renk', 'beden', 'mal no', 'barkod']
+
+_by_index = attrgetter('index')
+
+
+class _Node:
+    """Belgedeki bir etiketin hafif kaydı"""
+    __slots__ = ('name', 'attrs', 'index', 'end_index', 'text_start',
+                 'text_end', 'string', 'children', '_stripped')
+
+    def __init__(self, name, attrs, index, text_start):
+        self.name = name
+        self.attrs = attrs
+        self.index = index
+        self.end_index = None
+        self.text_start = text_start
+        self.text_end = None
+        self.string = None
+        self.children = 0
+        self._stripped = None
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+
+class StockPageIndex:
+    """lxml parser target'ı: olayları tek geçişte indekse dönüştürür"""
+
+    def __init__(self, on_table=None):
+        self.on_table = on_table
+        self.stopped = False
+        self.nodes = []
+        self.text = ''
+        self._by_name = defaultdict(list)
+        self._positions = defaultdict(list)
+        self._stack = []
+        self._containers = []
+        self._preserve = []
+        self._pending = []
+        self._parts = []
+        self._length = 0
+
+    # --- lxml target arayüzü ---
+
+    def start(self, name, attrs):
+        if self.stopped:
+            return
+        self._flush()
+        node = _Node(name, dict(attrs), len(self.nodes), self._length)
+        if self._stack:
+            self._stack[-1].children += 1
+        self.nodes.append(node)
+        self._by_name[name].append(node)
+        self._positions[name].append(node.index)
+        self._stack.append(node)
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self._preserve.append(node)
+        if name in STRING_CONTAINER_TAGS:
+            self._containers.append(node)
+
+    def end(self, name):
+        if self.stopped:
+            return
+        self._flush()
+        while self._stack:
+            node = self._close_node()
+            if node.name == name:
+                break
+
+    def data(self, content):
+        if not self.stopped:
+            self._pending.append(content)
+
+    def comment(self, text):
+        if self.stopped:
+            return
+        self._flush()
+        if self._stack:
+            self._stack[-1].children += 1
+
+    def pi(self, target, data):
+        self.comment(data)
+
+    def doctype(self, *args):
+        if not self.stopped:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        while self._stack:
+            self._close_node()
+        self.text = ''.join(self._parts)
+        self._parts = []
+        return self
+
+    # --- iç yardımcılar ---
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending = []
+        if not self._preserve and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None:
+            parent.children += 1
+            parent.string = data
+        if not self._containers:
+            self._parts.append(data)
+            self._length += len(data)
+
+    def _close_node(self):
+        node = self._stack.pop()
+        node.end_index = len(self.nodes)
+        node.text_end = self._length
+        if self._preserve and self._preserve[-1] is node:
+            self._preserve.pop()
+        if self._containers and self._containers[-1] is node:
+            self._containers.pop()
+        if node.name == 'table' and self.on_table is not None:
+            self.on_table(self, node)
+        return node
+
+    def stop(self):
+        """Sonraki olayları yok sayar; belge burada bitmiş gibi kapanır"""
+        self._flush()
+        self.stopped = True
+
+    def sync_text(self):
+        """Parse sürerken o ana kadarki metni get_text() için hazırlar"""
+        self._flush()
+        self.text = ''.join(self._parts)
+        self._parts = [self.text]
+
+    # --- sorgular ---
+
+    def find_all(self, names, within=None):
+        """Belge sırasıyla etiketleri döndürür (isteğe bağlı alt ağaç içinde)"""
+        if isinstance(names, str):
+            names = (names,)
+        found = []
+        for name in names:
+            nodes = self._by_name.get(name)
+            if not nodes:
+                continue
+            if within is None:
+                found.append(nodes)
+            else:
+                positions = self._positions[name]
+                lo = bisect_right(positions, within.index)
+                hi = bisect_left(positions, within.end_index, lo)
+                if lo < hi:
+                    found.append(nodes[lo:hi])
+        if not found:
+            return []
+        if len(found) == 1:
+            return list(found[0])
+        return sorted((node for group in found for node in group), key=_by_index)
+
+    def find(self, name):
+        nodes = self._by_name.get(name)
+        return nodes[0] if nodes else None
+
+    def get_text(self, node):
+        return self.text[node.text_start:node.text_end]
+
+    def stripped_text(self, node):
+        if node._stripped is None:
+            node._stripped = self.get_text(node).strip()
+        return node._stripped
+
+    def tag_string(self, node):
+        """BeautifulSoup Tag.string karşılığı (sadece tek metin çocuğu varsa)"""
+        return node.string if node.children == 1 else None
+
+
+def build_index(html):
+    """HTML metnini lxml ile tek geçişte indeksler"""
+    target = StockPageIndex()
+    parser = etree.HTMLParser(target=target, strip_cdata=False, recover=True)
+    if html:
+        parser.feed(html)
+        return parser.close()
+    return target.close()
+
+
+def is_product_heading(heading_text):
+    """Başlık metni ürün ismi olarak kullanılabilir mi"""
+    lowered = heading_text.lower()
+    return len(heading_text) > 5 and 'stok' not in lowered and 'mudo' not in lowered
+
+
+def script_product_name(script_content):
+    """Script içeriğindeki ürün ismi; yoksa None"""
+    for pattern in NAME_PATTERNS:
+        match = pattern.search(script_content)
+        if match and len(match.group(1)) > 5:
+            return match.group(1)
+    return None
+
+
+def is_product_name_row(label, value):
+    """(küçük harf etiket, değer) satırı ürün ismi mi"""
+    return ('ürün ad' in label or 'model ad' in label or 'isim' in label) and len(value) > 5
+
+
+def is_variant_header(header_texts):
+    joined_headers = ' '.join(header_texts)
+    return any(keyword in joined_headers for keyword in VARIANT_HEADER_KEYWORDS)
+
+
+class StockPageStream:
+    """Parça parça gelen sayfa gövdesini indeksler; erken durma noktasını bulur
+
+    is_store_row(mağaza metni, stok metni) mağaza tablosu satırını tanır.
+    Kapanan her tabloda ürün ismi (iter_stock_page'in kaynaklarından biri:
+    h1-h3, script, ürün bilgi tablosu), varyant tablosu ve en az bir mağaza
+    satırı olan (başka tablonun içinde olmayan) tablo görülmüş mü diye
+    bakılır; üçü de varsa complete olur ve indeks o noktada kapanır.
+    Sayfanın geri kalanındaki (footer, script, tablodan sonraki div/span
+    stok satırları) metinler indekse girmez.
+    """
+
+    def __init__(self, encoding='utf-8', is_store_row=None):
+        self.is_store_row = is_store_row
+        self.complete = False
+        self.bytes_fed = 0
+        self._product_name = False
+        self._variant_table = False
+        self._store_table = False
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._target = StockPageIndex(on_table=self._table_closed if is_store_row else None)
+        self._parser = etree.HTMLParser(target=self._target, strip_cdata=False, recover=True)
+        self._fed = False
+
+    def feed(self, chunk):
+        """Gövde parçasını (bytes) besler; gerekli bölümler yakalandıysa True"""
+        self.bytes_fed += len(chunk)
+        self._feed_text(self._decoder.decode(chunk))
+        return self.complete
+
+    def _feed_text(self, text):
+        if text:
+            self._parser.feed(text)
+            self._fed = True
+
+    def close(self):
+        """İndeksi tamamlar ve döndürür (açık kalan etiketler kapatılır)"""
+        if not self.complete:
+            self._feed_text(self._decoder.decode(b'', final=True))
+        if self._fed:
+            return self._parser.close()
+        return self._target.close()
+
+    def _table_closed(self, doc, table):
+        if self.complete:
+            return
+        doc.sync_text()
+        text = doc.stripped_text
+        headers = [text(th).lower() for th in doc.find_all('th', within=table)]
+        if is_variant_header(headers):
+            self._variant_table = True
+        elif any(node.name == 'table' for node in doc._stack):
+            # İç içe tablodaki satır mağaza tablosu sayılmaz; dış tablo kapanınca bakılır
+            return
+        else:
+            inner = [(t.index, t.end_index) for t in doc.find_all('table', within=table)]
+            for row in doc.find_all('tr', within=table):
+                if any(start < row.index < end for start, end in inner):
+                    continue
+                cells = doc.find_all(('td', 'th'), within=row)
+                if len(cells) < 2:
+                    continue
+                if is_product_name_row(text(cells[0]).lower(), text(cells[1])):
+                    self._product_name = True
+                elif self.is_store_row(text(cells[0]), text(cells[1])):
+                    self._store_table = True
+        if self._variant_table and self._store_table:
+            self.complete = self._product_name or self._has_product_name(doc)
+            if self.complete:
+                # Parçanın tablodan sonraki kısmı da indekse girmesin
+                doc.stop()
+
+    @staticmethod
+    def _has_product_name(doc):
+        """Kapanmış başlık veya script etiketlerinde ürün ismi var mı"""
+        for heading in doc.find_all(('h1', 'h2', 'h3')):
+            if heading.end_index is not None and is_product_heading(doc.stripped_text(heading)):
+                return True
+        for script in doc.find_all('script'):
+            content = doc.tag_string(script) if script.end_index is not None else None
+            if content and script_product_name(content):
+                return True
+        return False
+
+
+def _table_rows(doc):
+    """(tablo, satır, hücreler) üçlülerini bir kez hesaplar"""
+    rows = []
+    for table in doc.find_all('table'):
+        for row in doc.find_all('tr', within=table):
+            rows.append((table, row, doc.find_all(('td', 'th'), within=row)))
+    return rows
+
+
+def parse_stock_page(html):
+    """Stok sayfasından ürün bilgisi, varyantlar ve ham stok satırlarını çıkarır
+
+    Dönen sözlük: product_info, variants, stock_data (filtrelenmemiş).
+    """
+    return extract_stock_page(build_index(html))
+
+
+def extract_stock_page(doc):
+    """build_index() ile indekslenmiş sayfadan parse_stock_page sonucunu üretir"""
+    return dict(iter_stock_page(doc))
+
+
+def iter_stock_page(doc):
+    """extract_stock_page'in aşamalı hali
+
+    Her bölüm hazır olduğu anda sırasıyla ('product_info', ...),
+    ('variants', ...) ve ('stock_data', ...) ikilileri üretir; akış
+    (SSE) cevabı ürün bilgisini stok satırlarını beklemeden gönderebilir.
+    """
+    text = doc.stripped_text
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    stock_data = []
+    product_info = {}
+    variants = []
+
+    # 1. Ürün ismi ve başlık bilgisi (Title son çare)
+    page_title = doc.find('title')
+    if page_title:
+        title_text = text(page_title)
+        if title_text and title_text != PAGE_DEFAULT_TITLE:
+            product_info['title'] = title_text
+
+    product_name = None
+
+    # 1a. H1, H2, H3 başlıklarında ara
+    for heading in doc.find_all(('h1', 'h2', 'h3')):
+        heading_text = text(heading)
+        if heading_text and is_product_heading(heading_text):
+            product_name = heading_text
+            break
+
+    scripts = doc.find_all('script')
+
+    # 1b. Script tag'lerinde ürün ismi ara
+    if not product_name:
+        for script in scripts:
+            script_content = doc.tag_string(script)
+            if script_content:
+                product_name = script_product_name(script_content)
+            if product_name:
+                break
+
+    table_rows = _table_rows(doc)
+    labelled_rows = [
+        (text(cells[0]).lower(), text(cells[1]))
+        for _, _, cells in table_rows if len(cells) >= 2
+    ]
+
+    # 1c. Tablolarda ürün ismini ara
+    if not product_name:
+        for label, value in labelled_rows:
+            if is_product_name_row(label, value):
+                product_name = value
+                break
+
+    if product_name:
+        product_info['title'] = product_name
+    elif debug:
+        logger.debug("Ürün ismi bulunamadı, varsayılan başlık kullanılacak")
+
+    # Ürün detay bilgileri
+    product_details = {}
+    divs = []
+    spans = []
+    for element in doc.find_all(('div', 'span', 'td', 'p')):
+        if element.name == 'div':
+            divs.append(element)
+        elif element.name == 'span':
+            spans.append(element)
+
+        element_text = text(element)
+        lowered = element_text.lower()
+
+        if CODE_LABEL_RE.search(lowered):
+            code_match = CODE_RE.search(element_text)
+            if code_match:
+                product_details['product_code'] = code_match.group(1)
+
+        if PRICE_LABEL_RE.search(lowered) and DIGITS_RE.search(element_text):
+            price_match = PRICE_RE.search(element_text)
+            if price_match:
+                product_details['price'] = price_match.group(1).replace(',', '.') + ' TL'
+
+        if STATUS_LABEL_RE.search(lowered):
+            if 'açık' in lowered:
+                product_details['sale_status'] = 'Satışta'
+            elif 'kapalı' in lowered:
+                product_details['sale_status'] = 'Satış Dışı'
+
+        if '%' in element_text and DIGITS_RE.search(element_text):
+            discount_match = DISCOUNT_RE.search(element_text)
+            if discount_match:
+                product_details['discount'] = f"%{discount_match.group(1)} İndirim"
+
+    # Form elementlerinden bilgi
+    for inp in doc.find_all('input'):
+        if inp.get('id') or inp.get('name'):
+            field_name = (inp.get('id') or inp.get('name')).lower()
+            value = inp.get('value', '').strip()
+
+            if 'fiyat' in field_name and value and ANY_DIGIT_RE.search(value):
+                product_details['price'] = value + ' TL'
+            elif 'kod' in field_name and value:
+                product_details['product_code'] = value
+
+    # Tablo hücrelerinden ürün bilgileri
+    for label, value in labelled_rows:
+        if 'ürün no' in label or 'model no' in label:
+            product_details['product_code'] = value
+        elif 'fiyat' in label and value:
+            product_details['price'] = value
+        elif 'durum' in label or 'satış' in label:
+            product_details['sale_status'] = value
+
+    product_info.update(product_details)
+
+    if debug:
+        logger.debug("Ürün bilgisi çıkarıldı", extra=fields(product_info=product_info))
+
+    yield 'product_info', product_info
+
+    # 2. Varyant tablosu (Renk/Beden kombinasyonları)
+    rows_by_table = defaultdict(list)
+    for table, row, cells in table_rows:
+        rows_by_table[table.index].append(cells)
+
+    for table in doc.find_all('table'):
+        header_texts = [text(th).lower() for th in doc.find_all('th', within=table)]
+        if not is_variant_header(header_texts):
+            continue
+
+        for cells in rows_by_table[table.index][1:]:  # İlk satır başlık
+            if len(cells) < 4:
+                continue
+            color = text(cells[0])
+            size = text(cells[1])
+            product_code = text(cells[2])
+            variant_barcode = text(cells[3])
+
+            if color and size and is_gtin(variant_barcode):
+                variants.append({
+                    'color': color,
+                    'size': size,
+                    'product_code': product_code,
+                    'barcode': variant_barcode,
+                    'display_name': f"{color} - {size}"
+                })
+
+    yield 'variants', variants
+
+    # 3. Tablo satırlarındaki stok bilgileri
+    for _, _, cells in table_rows:
+        if len(cells) >= 2:
+            store_name = text(cells[0])
+            stock_count = text(cells[1])
+            if store_name and (DIGITS_RE.search(stock_count) or 'stok' in stock_count.lower()):
+                stock_data.append({
+                    'store': store_name,
+                    'stock': stock_count
+                })
+
+    # 4. Div elementlerindeki stok bilgileri
+    for div in divs:
+        div_text = text(div)
+        for pattern in DIV_STOCK_PATTERNS:
+            for match in pattern.finditer(div_text):
+                store_name = match.group(1).strip()
+                stock_count = match.group(2).strip()
+                if 2 < len(store_name) < 50:
+                    stock_data.append({
+                        'store': store_name,
+                        'stock': stock_count
+                    })
+
+    # 5. Span elementlerindeki mağaza/stok eşleşmeleri
+    store_names = []
+    stock_counts = []
+    for span in spans:
+        span_text = text(span)
+        if ONLY_DIGITS_RE.match(span_text):
+            stock_counts.append(span_text)
+        elif 3 < len(span_text) < 50 and '©' not in span_text and 'http' not in span_text:
+            store_names.append(span_text)
+
+    for store_name, stock_count in zip(store_names, stock_counts):
+        stock_data.append({
+            'store': store_name,
+            'stock': stock_count
+        })
+
+    # 6. Script taglerindeki JSON verileri (sadece debug, production'da atlanır)
+    if debug:
+        for script in scripts:
+            script_content = doc.tag_string(script)
+            if script_content and any(keyword in script_content.lower() for keyword in ['stok', 'stock', 'magaza']):
+                for match in SCRIPT_JSON_RE.findall(script_content):
+                    try:
+                        data = json.loads(match)
+                    except json.JSONDecodeError:
+                        continue
+                    logger.debug("Script JSON verisi", extra=fields(data=data))
+
+    yield 'stock_data', stock_data
@@ -0,0 +1,93 @@
+"""Mağaza kayıt defteri ve önceden derlenmiş mağaza eşleştirici.
+
+Ham tablo/div metnini tek bir regex taramasıyla mağazaya eşler:
+- KNOWN_STORES: kodu ve kanonik ismi bilinen mağazalar, tek bir named-group
+  alternation'ı olarak derlenir
+- STORE_KEYWORDS: gerçek mağaza ismi olduğunu gösteren kelimeler (whitelist),
+  tek bir alternation olarak derlenir
+
+Kayıtta olmayan mağazaların kodu isimdeki "(123)" ekinden okunur; kod yoksa
+temizlenmiş isimden türetilen bir slug kimlik olarak kullanılır.
+"""
+import os
+import re
+from collections import namedtuple
+
+Store = namedtuple('Store', ['code', 'name', 'pattern'])
+
+StoreMatch = namedtuple('StoreMatch', ['id', 'code', 'name'])
+
+# Kodu bilinen mağazalar (pattern küçük harfe çevrilmiş ham metinde aranır)
+KNOWN_STORES = [
+    Store('183', 'Vadistanbul City', r'vadistanbul.*city|city.*vadistanbul'),
+]
+
+# Gerçek mağaza isimlerini tanımlayan kelimeler (whitelist yaklaşımı)
+STORE_KEYWORDS = [
+    # City mağazaları
+    'city', 'vadistanbul', 'mall', 'avm', 'center',
+    # Giyim mağazaları
+    'giyim', 'home', 'concept', 'marina', 'outlet',
+    # Şehir isimleri içeren mağazalar
+    'istanbul', 'ankara', 'izmir', 'bursa', 'antalya',
+    'adana', 'trabzon', 'kayseri', 'samsun', 'gaziantep',
+    'malatya', 'eskişehir', 'bodrum', 'marmaris',
+    # Belirli mağaza isimleri
+    'akmerkez', 'cevahir', 'carousel', 'palladium',
+    'nautilus', 'aqua', 'tema', 'nişantaşı', 'maslak',
+    'pendik', 'capitol', 'çanakkale', 'balıkesir',
+    'tekirdağ', 'bandırma', 'mersin', 'alanya',
+]
+
+DEFAULT_PRIORITY_STORE = '183'
+
+CODE_SUFFIX_RE = re.compile(r'\((\d+)\)\s*$')
+WHITESPACE_RE = re.compile(r'\s+')
+SLUG_RE = re.compile(r'[^0-9a-zçğıöşü]+')
+
+
+class StoreRegistry:
+    """Kanonik mağaza isimleri/kodları ve derlenmiş eşleştirici"""
+
+    def __init__(self, stores=KNOWN_STORES, keywords=STORE_KEYWORDS,
+                 priority_code=DEFAULT_PRIORITY_STORE):
+        self.stores = {store.code: store for store in stores}
+        self.priority_code = priority_code
+        self._known_re = re.compile(
+            '|'.join(f'(?P<s{store.code}>{store.pattern})' for store in stores),
+            re.DOTALL
+        ) if stores else None
+        self._keyword_re = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+    @classmethod
+    def from_env(cls):
+        """Öncelikli mağaza kodunu MUDO_PRIORITY_STORE'dan okur"""
+        return cls(priority_code=os.environ.get('MUDO_PRIORITY_STORE', DEFAULT_PRIORITY_STORE))
+
+    def display_name(self, code):
+        store = self.stores[code]
+        return f"{store.name} ({store.code})"
+
+    def match(self, raw_name):
+        """Ham mağaza metnini StoreMatch'e çevirir; mağaza değilse None"""
+        lowered = raw_name.lower()
+
+        if self._known_re is not None:
+            known = self._known_re.search(lowered)
+            if known:
+                code = known.lastgroup[1:]
+                return StoreMatch(code, code, self.display_name(code))
+
+        if not self._keyword_re.search(lowered):
+            return None
+
+        # Satır sonlarını ve gereksiz boşlukları temizle
+        clean_name = WHITESPACE_RE.sub(' ', raw_name.strip())
+        code_match = CODE_SUFFIX_RE.search(clean_name)
+        if code_match:
+            code = code_match.group(1)
+            return StoreMatch(code, code, clean_name)
+        return StoreMatch(SLUG_RE.sub('-', clean_name.lower()).strip('-'), None, clean_name)
+
+    def is_priority(self, match):
+        return match.code is not None and match.code == self.priority_code
@@ -0,0 +1,454 @@
+"""mudonetapps upstream'i için havuzlu, keep-alive HTTP istemcisi.
+
+Her worker süreci tek bir requests.Session kullanır; TCP bağlantıları
+havuzda tutulup sonraki sorgularda yeniden kullanılır. Bağlantı seviyesindeki
+hatalar (reset, connect timeout) jitter'lı üstel geri çekilme ile toplam bir
+zaman bütçesi içinde tekrar denenir. Read timeout tekrar denenmez; yavaş bir
+upstream'e ikinci kez yüklenmek sadece bekleme süresini uzatır.
+
+AsyncUpstreamClient aynı ayarları ve retry politikasını ASGI modu için
+httpx.AsyncClient üzerinde uygular.
+
+Her iki istemci de bağlantı kurma, TTFB ve gövde indirme sürelerini ayrı
+fazlar olarak metrics modülüne yazar.
+
+Çağrılar bir devre kesiciden geçer (bkz. breaker): upstream çökmüşken
+istekler timeout beklemeden CircuitOpenError ile döner. Read timeout sabit
+değildir; gözlenen TTFB p95'ine göre read_timeout üst sınırına kadar ayarlanır.
+
+Her çağrı önce hız sınırlayıcıdan (bkz. ratelimit) çağrının önceliğiyle jeton
+alır; tekrar denemeler ek jeton harcamaz. priority=None çağrıların jetonu
+reserve() ile önceden alınmıştır (bkz. app.prepaid_fetch).
+
+stream=True çağrılarında gövde çağıran tarafından okunur. Cevap
+StreamedResponse ile sarılır; çağrının devre kesici sonucu, süresi ve
+in-flight sayacı gövde okunup cevap kapatılınca yazılır. Böylece gövde
+indirilirken oluşan timeout ve reset'ler de devre kesiciye ulaşır.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+
+from breaker import AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+from log import fields, logger
+from metrics import (
+    UPSTREAM_IN_FLIGHT,
+    UPSTREAM_REQUESTS,
+    UPSTREAM_RETRIES,
+    observe_phase,
+    timed,
+)
+from ratelimit import INTERACTIVE, RateLimitError, RateLimiter
+
+# Benchmark/yük testlerinde yerel stub'a yönlendirilebilir (bkz. bench/stub_upstream.py)
+STOCK_URL = os.environ.get(
+    'MUDO_UPSTREAM_URL', "http://mudonetapps.mudo.com.tr/StokSorgula/StokSorgula?kod={barcode}"
+)
+
+# HTTP headers - gerçek tarayıcı gibi görünmek için
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'tr-TR,tr;q=0.8,en-US;q=0.5,en;q=0.3',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+def request_outcome(error):
+    """Upstream hatasını metrik etiketine çevirir"""
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return 'timeout'
+    # requests gövde okurken oluşan read timeout'u ConnectionError ile sarar
+    if (isinstance(error, requests.exceptions.ConnectionError) and error.args
+            and isinstance(error.args[0], ReadTimeoutError)):
+        return 'timeout'
+    if isinstance(error, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        return 'connection_error'
+    return 'error'
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with timed('upstream_connect'):
+            super().connect()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with timed('upstream_connect'):
+            super().connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Yeni TCP bağlantılarının kurulma süresini ölçen adapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class StreamedResponse:
+    """Gövdesi henüz okunmamış cevap; çağrı kaydı gövde bitince yapılır
+
+    Çağrı süresi başlıklara kadar geçen süre ile gövde parçalarının
+    beklendiği sürenin toplamıdır; çağıranın parçalar arasındaki parse işi
+    sayılmaz. Gövde okunurken oluşan hata çağrıyı başarısız sayar; close()
+    (erken bırakma dahil) başarılı sayar.
+    """
+
+    def __init__(self, client, response, elapsed):
+        self.response = response
+        self._client = client
+        self._elapsed = elapsed
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def _waited(self, start, error=None):
+        self._elapsed += time.perf_counter() - start
+        if error is not None:
+            self._finish(error)
+
+    def _finish(self, error=None):
+        if not self._done:
+            self._done = True
+            self._client.finish_call(self._elapsed, self.response.status_code, error)
+
+    def iter_content(self, chunk_size=1):
+        chunks = self.response.iter_content(chunk_size)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks, None)
+            except Exception as e:
+                self._waited(start, e)
+                raise
+            self._waited(start)
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        self.response.close()
+        self._finish()
+
+
+class AsyncStreamedResponse(StreamedResponse):
+    """StreamedResponse'un httpx karşılığı"""
+
+    async def aiter_bytes(self, chunk_size=None):
+        chunks = self.response.aiter_bytes(chunk_size)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                self._waited(start)
+                return
+            except BaseException as e:
+                self._waited(start, e)
+                raise
+            self._waited(start)
+            yield chunk
+
+    async def aclose(self):
+        await self.response.aclose()
+        self._finish()
+
+
+class UpstreamClient:
+    """Süreç başına bağlantı havuzu, bölünmüş timeout ve retry bütçesi"""
+
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=15,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0, time_budget=20,
+                 min_read_timeout=3, timeout_multiplier=3, breaker=None, limiter=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.time_budget = time_budget
+        self.read_timeouts = AdaptiveTimeout(max_timeout=read_timeout, min_timeout=min_read_timeout,
+                                             multiplier=timeout_multiplier)
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or RateLimiter()
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, limiter=None):
+        """Ayarları ortam değişkenlerinden okur; limiter worker'lar arası paylaşılır"""
+        return cls(
+            pool_size=int(os.environ.get('MUDO_UPSTREAM_POOL_SIZE', 10)),
+            connect_timeout=float(os.environ.get('MUDO_UPSTREAM_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.environ.get('MUDO_UPSTREAM_READ_TIMEOUT', 15)),
+            max_retries=int(os.environ.get('MUDO_UPSTREAM_RETRIES', 2)),
+            backoff_base=float(os.environ.get('MUDO_UPSTREAM_BACKOFF', 0.2)),
+            time_budget=float(os.environ.get('MUDO_UPSTREAM_TIME_BUDGET', 20)),
+            min_read_timeout=float(os.environ.get('MUDO_UPSTREAM_MIN_READ_TIMEOUT', 3)),
+            timeout_multiplier=float(os.environ.get('MUDO_UPSTREAM_TIMEOUT_MULTIPLIER', 3)),
+            breaker=CircuitBreaker.from_env(),
+            limiter=limiter,
+        )
+
+    @property
+    def session(self):
+        """Worker sürecine ait Session (fork sonrası yeniden oluşturulur)"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(DEFAULT_HEADERS)
+                    self._session = session
+                    self._session_pid = pid
+        return self._session
+
+    def backoff_delay(self, attempt):
+        """Jitter'lı üstel bekleme süresi (full jitter)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def retry_delay(self, attempt, remaining):
+        """Tekrar denenecekse bekleme süresini, denenmeyecekse None döndürür"""
+        if attempt >= self.max_retries:
+            return None
+        delay = self.backoff_delay(attempt)
+        if delay + self.connect_timeout > remaining:
+            return None
+        return delay
+
+    def finish_call(self, elapsed, status_code=None, error=None):
+        """Çağrının sonucunu devre kesiciye ve metriklere yazar, in-flight'ı düşürür
+
+        İptal (CancelledError, GeneratorExit) upstream hatası sayılmaz.
+        """
+        UPSTREAM_IN_FLIGHT.dec()
+        if error is not None and not isinstance(error, Exception):
+            return
+        if error is not None:
+            self.breaker.record(False, elapsed)
+            UPSTREAM_REQUESTS.labels(request_outcome(error)).inc()
+            return
+        self.breaker.record(status_code < 500, elapsed)
+        UPSTREAM_REQUESTS.labels('ok' if status_code < 400 else 'http_error').inc()
+
+    def allow(self, probe=True):
+        """Devre açıksa çağrıyı upstream'e gitmeden reddeder
+
+        probe=False yarı açık devrenin deneme hakkını almadan kontrol eder.
+        """
+        try:
+            if probe:
+                self.breaker.allow()
+            else:
+                self.breaker.check()
+        except CircuitOpenError:
+            UPSTREAM_REQUESTS.labels('circuit_open').inc()
+            raise
+
+    def reserve(self, priority=INTERACTIVE):
+        """Devre açık değilse çağrı için jetonu önceden alır; sonra get(priority=None)
+
+        Yarı açık devrenin deneme hakkı burada alınmaz, get()'teki asıl
+        çağrıya kalır.
+        """
+        self.allow(probe=False)
+        try:
+            self.limiter.acquire(priority)
+        except RateLimitError:
+            UPSTREAM_REQUESTS.labels('rate_limited').inc()
+            raise
+
+    def get(self, url, priority=INTERACTIVE, stream=False, **kwargs):
+        """GET isteği; bağlantı hatalarında bütçe dolana kadar tekrar dener
+
+        Retry sadece cevap başlıkları alınana kadarki bağlantı hatalarını
+        kapsar; gövde okunurken oluşan hata doğrudan yükseltilir. stream ise
+        gövde okunmaz; StreamedResponse döner, çağıran iter_content ile okur
+        ve cevabı kapatır.
+        """
+        if priority is not None:
+            self.reserve(priority)
+        self.allow()
+        read_timeout = self.read_timeouts.timeout()
+        call_start = time.perf_counter()
+        deadline = time.monotonic() + self.time_budget
+        attempt = 0
+        UPSTREAM_IN_FLIGHT.inc()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                timeout = (min(self.connect_timeout, remaining), min(read_timeout, remaining))
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(url, timeout=timeout, stream=True, **kwargs)
+                    break
+                except requests.exceptions.ConnectionError as e:
+                    delay = self.retry_delay(attempt, deadline - time.monotonic())
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    UPSTREAM_RETRIES.inc()
+                    logger.warning("Upstream bağlantı hatası, tekrar denenecek",
+                                   extra=fields(url=url, attempt=attempt, delay=round(delay, 3), error=str(e)))
+                    time.sleep(delay)
+
+            ttfb = time.perf_counter() - start
+            observe_phase('upstream_ttfb', ttfb)
+            self.read_timeouts.observe(ttfb)
+            if not stream:
+                with timed('upstream_download'):
+                    response.content  # gövdeyi oku; bağlantı havuza döner
+        except BaseException as e:
+            if isinstance(e, requests.exceptions.ReadTimeout):
+                self.read_timeouts.observe(time.perf_counter() - start)
+            self.finish_call(time.perf_counter() - call_start, error=e)
+            raise
+
+        if stream:
+            return StreamedResponse(self, response, time.perf_counter() - call_start)
+        self.finish_call(time.perf_counter() - call_start, response.status_code)
+        return response
+
+
+class AsyncUpstreamClient(UpstreamClient):
+    """httpx tabanlı async istemci; tek süreçte çok sayıda bekleyen sorgu"""
+
+    # Bağlantı seviyesindeki hatalar (requests.ConnectionError karşılığı)
+    RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout,
+                        httpx.RemoteProtocolError, httpx.ReadError)
+
+    def __init__(self, max_connections=200, **kwargs):
+        super().__init__(**kwargs)
+        self.max_connections = max_connections
+        self._client = None
+
+    @classmethod
+    def from_env(cls, limiter=None):
+        client = super().from_env(limiter)
+        client.max_connections = int(os.environ.get('MUDO_UPSTREAM_MAX_CONNECTIONS', 200))
+        return client
+
+    @property
+    def client(self):
+        """Event loop'a ait AsyncClient (ilk kullanımda oluşturulur)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=DEFAULT_HEADERS,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.pool_size),
+            )
+        return self._client
+
+    @staticmethod
+    def _connect_tracer():
+        """httpcore trace olaylarından bağlantı kurma süresini ölçer"""
+        started = []
+
+        async def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                started.append(time.perf_counter())
+            elif event_name == 'connection.connect_tcp.complete' and started:
+                observe_phase('upstream_connect', time.perf_counter() - started.pop())
+
+        return trace
+
+    async def reserve_async(self, priority=INTERACTIVE):
+        """reserve() karşılığı"""
+        self.allow(probe=False)
+        try:
+            await self.limiter.acquire_async(priority)
+        except RateLimitError:
+            UPSTREAM_REQUESTS.labels('rate_limited').inc()
+            raise
+
+    async def get(self, url, priority=INTERACTIVE, stream=False, **kwargs):
+        """Async GET; bağlantı hatalarında bütçe dolana kadar tekrar dener
+
+        stream ise gövde okunmaz; AsyncStreamedResponse döner, çağıran
+        aiter_bytes ile okur ve aclose eder.
+        """
+        if priority is not None:
+            await self.reserve_async(priority)
+        self.allow()
+        read_timeout = self.read_timeouts.timeout()
+        call_start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.time_budget
+        attempt = 0
+        UPSTREAM_IN_FLIGHT.inc()
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                timeout = httpx.Timeout(min(read_timeout, remaining),
+                                        connect=min(self.connect_timeout, remaining))
+                request = self.client.build_request(
+                    'GET', url, timeout=timeout,
+                    extensions={'trace': self._connect_tracer()}, **kwargs
+                )
+                start = time.perf_counter()
+                try:
+                    response = await self.client.send(request, stream=True)
+                    break
+                except self.RETRYABLE_ERRORS as e:
+                    delay = self.retry_delay(attempt, deadline - loop.time())
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    UPSTREAM_RETRIES.inc()
+                    logger.warning("Upstream bağlantı hatası, tekrar denenecek",
+                                   extra=fields(url=url, attempt=attempt, delay=round(delay, 3), error=str(e)))
+                    await asyncio.sleep(delay)
+
+            ttfb = time.perf_counter() - start
+            observe_phase('upstream_ttfb', ttfb)
+            self.read_timeouts.observe(ttfb)
+            if not stream:
+                try:
+                    with timed('upstream_download'):
+                        await response.aread()
+                finally:
+                    await response.aclose()
+        except BaseException as e:
+            if isinstance(e, httpx.ReadTimeout):
+                self.read_timeouts.observe(time.perf_counter() - start)
+            self.finish_call(time.perf_counter() - call_start, error=e)
+            raise
+
+        if stream:
+            return AsyncStreamedResponse(self, response, time.perf_counter() - call_start)
+        self.finish_call(time.perf_counter() - call_start, response.status_code)
+        return response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None